@@ -1,12 +1,167 @@
 import os
+import time
 import yaml
+import threading
 import pymysql.cursors
+from collections import deque
+
+
+#default pool settings, can be overridden per database alias in the config file
+POOL_SIZE = 5
+POOL_IDLE_SECONDS = 300
+POOL_WAIT_SECONDS = 10
+
+#module wide pool registry so all db_conn instances share connections
+POOLS = {}
+POOLS_LOCK = threading.Lock()
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class db_pool(object):
+    '''
+    Bounded, thread safe pool of connections for one database alias.
+
+    Connections are pinged when borrowed, closed once they have been idle for
+    longer than idle_seconds and a borrow waits at most wait_seconds for a
+    connection to be returned when the pool is at max size.
+
+    Inputs:
+    - opener: function that returns a new connection (or None on failure)
+    - pinger: function that checks/revives a connection, raises if it is dead
+    - size: max number of open connections (idle + checked out)
+    - idle_seconds: idle connections older than this are closed
+    - wait_seconds: max time to wait for a free connection
+    '''
+
+    def __init__(self, opener, pinger=None, size=POOL_SIZE,
+                 idle_seconds=POOL_IDLE_SECONDS, wait_seconds=POOL_WAIT_SECONDS):
+
+        self.opener = opener
+        self.pinger = pinger
+        self.size = max(int(size), 1)
+        self.idle_seconds = idle_seconds
+        self.wait_seconds = wait_seconds
+
+        self.idle = deque()
+        self.num_open = 0
+        self.cond = threading.Condition()
+        self.stats = {'created': 0, 'reused': 0, 'evicted': 0, 'waits': 0,
+                      'timeouts': 0}
+
+
+    def acquire(self):
+        '''
+        Borrow a connection.  Raises PoolExhausted if none is free in time.
+        '''
+
+        deadline = time.monotonic() + self.wait_seconds
+        with self.cond:
+            while True:
+                self._evict_idle()
+
+                #reuse most recently returned connection if it is still alive
+                while self.idle:
+                    conn, _ = self.idle.pop()
+                    if self._ping(conn):
+                        self.stats['reused'] += 1
+                        return conn
+                    self._discard(conn)
+
+                #room for a new connection
+                if self.num_open < self.size:
+                    self.num_open += 1
+                    break
+
+                #wait for one to be released
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.stats['timeouts'] += 1
+                    raise PoolExhausted(f"no free connection after {self.wait_seconds}s "
+                                        f"(size={self.size})")
+                self.stats['waits'] += 1
+                self.cond.wait(remaining)
+
+        #open outside the lock so a slow handshake does not block other threads
+        try:
+            conn = self.opener()
+        except Exception:
+            conn = None
+        if not conn:
+            with self.cond:
+                self.num_open -= 1
+                self.cond.notify()
+            return None
+
+        with self.cond:
+            self.stats['created'] += 1
+        return conn
+
+
+    def release(self, conn, broken=False):
+        '''
+        Return a borrowed connection.  Broken connections are closed.
+        '''
+
+        if not conn:
+            return
+        with self.cond:
+            if broken or getattr(conn, 'open', True) is False:
+                self._discard(conn)
+            else:
+                self.idle.append((conn, time.monotonic()))
+            self.cond.notify()
+
+
+    def close(self):
+        '''
+        Close all idle connections.  Checked out connections are closed on release.
+        '''
+
+        with self.cond:
+            while self.idle:
+                conn, _ = self.idle.pop()
+                self._discard(conn)
+            self.cond.notify_all()
+
+
+    def _evict_idle(self):
+
+        #oldest connections are at the left of the deque
+        now = time.monotonic()
+        while self.idle and now - self.idle[0][1] > self.idle_seconds:
+            conn, _ = self.idle.popleft()
+            self._discard(conn)
+            self.stats['evicted'] += 1
+
+
+    def _ping(self, conn):
+
+        if not self.pinger:
+            return True
+        try:
+            self.pinger(conn)
+        except Exception:
+            return False
+        return True
+
+
+    def _discard(self, conn):
+
+        self.num_open -= 1
+        try:
+            conn.close()
+        except Exception:
+            pass
 
 
 class db_conn(object):
     '''
     Simple database connection and query layer.  
-    Opens and closes and new connection each query.
+    Borrows a pooled connection for each query and returns it afterwards.
+    With persist=True, each thread keeps its borrowed connection until close().
     Define db connection params in config file.
 
     Config file follows yaml format and should contain one dict entry per database:
@@ -19,6 +174,9 @@ class db_conn(object):
             "pwd"    : (db password,
             "port"   : (db server port),
             "type"   : (db type: mysql, postgresql),
+            "pool_size" : (optional, max open connections),
+            "pool_idle" : (optional, seconds before idle connection is closed),
+            "pool_wait" : (optional, seconds to wait for a free connection),
         },
     }
     Inputs:
@@ -35,28 +193,84 @@ class db_conn(object):
 
         #parse config file
         assert os.path.isfile(configFile), f"ERROR: config file '{configFile}' does not exist.  Exiting."
+        self.configFile = os.path.abspath(configFile)
+        self.configKey = configKey
         with open(configFile) as f: self.config = yaml.safe_load(f)
         if configKey:
             assert configKey in self.config, f"ERROR: config key '{configKey}' does not exist in config file. Exiting." 
             self.config = self.config[configKey]
 
-        #keep dict of database connections
-        self.conns = {}
+        #connections checked out by this thread when persisting
+        self.local = threading.local()
 
 
     def connect(self, database_alias):
         '''
-        Connect to the specified database.  
+        Borrow a connection to the specified database from the pool.
+        Connections must be given back with release() unless persisting.
         '''
 
-        #see if we already have a connection and if so ping it to keep alive and return it.
-        #todo: read about conn.open == False?
+        #see if this thread already has a connection and if so ping it to keep alive and return it.
         if self.persist:
-            if database_alias in self.conns and self.conns[database_alias]:
-                conn = self.conns[database_alias]
-                conn.ping(reconnect=True)
-                return conn
+            conns = self._thread_conns()
+            conn = conns.get(database_alias)
+            if conn:
+                try:
+                    self._ping(database_alias, conn)
+                    return conn
+                except Exception:
+                    del conns[database_alias]
+                    self.get_pool(database_alias).release(conn, broken=True)
+
+        conn = self.get_pool(database_alias).acquire()
+
+        #save connection
+        if self.persist and conn:
+            self._thread_conns()[database_alias] = conn
+
+        return conn
+
+
+    def release(self, database_alias, conn, broken=False):
+        '''
+        Return a connection from connect() to the pool.  Persisted connections
+        stay with the thread until close() unless broken.
+        '''
 
+        if not conn:
+            return
+        conns = self._thread_conns()
+        if self.persist and conns.get(database_alias) is conn:
+            if not broken:
+                return
+            del conns[database_alias]
+        self.get_pool(database_alias).release(conn, broken=broken)
+
+
+    def get_pool(self, database_alias):
+        '''
+        Get (or create) the shared pool for the database alias.
+        '''
+
+        key = (self.configFile, self.configKey, database_alias)
+        with POOLS_LOCK:
+            pool = POOLS.get(key)
+            if not pool:
+                assert database_alias in self.config, f"ERROR: database '{database_alias}' not defined in config file.  Exiting."
+                config = self.config[database_alias]
+                pool = db_pool(lambda: self._open(database_alias),
+                               lambda conn: self._ping(database_alias, conn),
+                               size=config.get('pool_size', POOL_SIZE),
+                               idle_seconds=config.get('pool_idle', POOL_IDLE_SECONDS),
+                               wait_seconds=config.get('pool_wait', POOL_WAIT_SECONDS))
+                POOLS[key] = pool
+        return pool
+
+
+    def _open(self, database_alias):
+        '''
+        Open a new connection to the specified database.  
+        '''
 
         #get db connect data
         assert database_alias in self.config, f"ERROR: database '{database_alias}' not defined in config file.  Exiting."
@@ -82,32 +296,47 @@ class db_conn(object):
             print ("ERROR: Could not connect to database.")
             print ('ERROR: ', e)
 
-        #save connection
-        if self.persist:
-            self.conns[database_alias] = conn
-
         return conn
 
 
+    def _ping(self, database_alias, conn):
+
+        #raises if the connection is dead and cannot be revived
+        if self.config[database_alias]['type'] == 'mysql':
+            conn.ping(reconnect=True)
+        elif conn.closed:
+            raise Exception('connection closed')
+
+
+    def _thread_conns(self):
+
+        if not hasattr(self.local, 'conns'):
+            self.local.conns = {}
+        return self.local.conns
+
+
     def close(self, database=None):
 
-        #close all connections unless they specify one
-        #todo: do we need to track the cursor and close it as well?
-        for key, conn in self.conns.items():
+        #return this thread's connections unless they specify one
+        conns = self._thread_conns()
+        for key in list(conns.keys()):
             if database and key != database: 
                 continue
-            if conn:
-                conn.close()
+            conn = conns.pop(key)
+            self.get_pool(key).release(conn)
 
 
     def query(self, database, query, getOne=False, getColumn=False, getInsert=False):
         '''
         Executes basic query.  Determines query type and returns fetchall on select, otherwise rowcount on other query types.
-        Returns false on any exception error.  Opens and closes a new connection each time.
+        Returns false on any exception error.  Borrows a pooled connection each time.
         '''
 
         query = ''.join(query)
         result = False
+        conn = None
+        cursor = None
+        broken = False
 
         try:
             conn = self.connect(database)
@@ -150,11 +379,11 @@ class db_conn(object):
         except Exception as err:
             print (f'ERROR: {err}')
             result = False
+            broken = isinstance(err, pymysql.err.OperationalError)
 
         finally:
-            if not self.persist:
-                if cursor: cursor.close()
-                if conn: conn.close()
+            if cursor: cursor.close()
+            self.release(database, conn, broken=broken)
 
         return result
 
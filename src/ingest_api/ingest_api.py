@@ -20,6 +20,7 @@ from ingest_api.ingest_api_lev1 import update_lev1_parameters
 from ingest_api.ingest_api_lev2 import update_lev2_parameters
 
 from utils.koa_pi_notify import KoaPiNotify
+from utils.koa_rti_cache import note_activity
 
 
 #module globals
@@ -265,6 +266,7 @@ def ingest_api_get():
         conn = db_conn('./config.live.ini')
         parsedParams = funcs[parsedParams['ingesttype']](parsedParams, reingest, CONFIG, conn, dbUser=dbname)
         log.info(f'ingest_api_get: returned parameters - {parsedParams}')
+        note_activity()
 
         #One more error check in case anything went wrong with db update
         if 'status' in parsedParams.keys() and parsedParams['apiStatus'] == 'ERROR':
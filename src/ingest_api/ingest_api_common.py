@@ -1,6 +1,19 @@
 from functools import wraps
 from datetime import datetime as dt
 
+import logging
+log = logging.getLogger('wmko_rti_api')
+
+#daily status rollup rows from koa_status, see migrations/koa_status_daily.py
+STATUS_DAILY_INSERT = ("insert into koa_status_daily "
+    "(utdate, instrument, level, status, num_files, filesize_mb, archsize_mb) "
+    "select koaid_date, instrument, level, coalesce(status, ''), count(*), "
+    "coalesce(sum(filesize_mb), 0), coalesce(sum(archsize_mb), 0) "
+    "from koa_status where {where} "
+    "group by koaid_date, instrument, level, coalesce(status, '') "
+    "on duplicate key update num_files=values(num_files), "
+    "filesize_mb=values(filesize_mb), archsize_mb=values(archsize_mb)")
+
 class DateParseException(Exception):
     pass
 
@@ -61,9 +74,77 @@ def update_db_data(parsedParams, config, conn, dbUser, defaultMsg=''):
     elif result != 1:
         parsedParams['apiStatus'] = 'ERROR'
         parsedParams['ingestErrors'].append('error updating ipac_response_time')
+    else:
+        refresh_status_daily(conn, dbUser, parsedParams['instrument'], level, koaid_utdate(koaid))
 
     return result, parsedParams
 
+def query_transaction(conn, dbUser, queries):
+    '''
+    Run the (query, params) statements in one transaction on one pooled
+    connection, readers see all or none of them.  Rolled back on any error.
+    Returns the rowcount of the last statement, False on error.
+    '''
+
+    connection = conn.connect(dbUser)
+    if not connection:
+        log.error('query_transaction: could not connect')
+        return False
+
+    broken = False
+    result = False
+    try:
+        connection.begin()
+        with connection.cursor() as cursor:
+            for query, params in queries:
+                result = cursor.execute(query, params)
+        connection.commit()
+    except Exception as err:
+        log.error(f'query_transaction: {err}')
+        try:
+            connection.rollback()
+        except Exception:
+            pass
+        broken = True
+        result = False
+    finally:
+        conn.release(dbUser, connection, broken=broken)
+
+    return result
+
+def refresh_status_daily(conn, dbUser, instrument, level, utdate):
+    '''
+    Recount the koa_status_daily rows of one instrument, level and UT date
+    (YYYYMMDD or YYYY-MM-DD) after a koa_status write.  The rows are zeroed
+    and recounted in one transaction.  Errors are only logged, the rollup
+    is repaired by the reconciliation job.
+    '''
+
+    try:
+        utdate = dt.strptime(utdate.replace('-', ''), '%Y%m%d').strftime('%Y-%m-%d')
+    except (AttributeError, ValueError):
+        log.error(f'refresh_status_daily: invalid utdate {utdate}')
+        return False
+
+    key = "instrument=%s and level=%s"
+    params = (utdate, instrument, int(level))
+    queries = [(f"update koa_status_daily set num_files=0, filesize_mb=0, "
+                f"archsize_mb=0 where utdate=%s and {key}", params),
+               (STATUS_DAILY_INSERT.format(where=f"koaid_date=%s and {key}"), params)]
+    result = query_transaction(conn, dbUser, queries)
+    if result is False:
+        log.error(f'refresh_status_daily: failed for {instrument} lev{level} {utdate}')
+
+    return result
+
+def koaid_utdate(koaid):
+    '''Return the YYYYMMDD UT date part of a KOAID.'''
+
+    try:
+        return koaid.split('.')[1]
+    except (AttributeError, IndexError):
+        return None
+
 def query_all_koaid(conn, dbUser, instrument, level, utdate):
     '''Return all koaids for level and utdate.'''
 
@@ -53,6 +53,8 @@ def update_lev1_parameters(parsedParams, reingest, config, conn, dbUser='koa_tes
             if result != 1:
                 parsedParams['apiStatus'] = 'ERROR'
                 parsedParams['ingestErrors'].append('error adding to koa_status')
+            else:
+                refresh_status_daily(conn, dbUser, instrument, level, koaid_utdate(koaid))
             parsedParams['apiStatus'] = 'COMPLETE'
             parsedParams['ingestErrors'] = []
         else:
@@ -84,6 +86,7 @@ def update_lev1_parameters(parsedParams, reingest, config, conn, dbUser='koa_tes
                 parsedParams['apiStatus'] = 'ERROR'
                 parsedParams['ingestErrors'].append('error adding to koa_status')
                 return parsedParams
+            refresh_status_daily(conn, dbUser, instrument, level, koaid_utdate(koaid))
 
         # Note whether or not things are good
         parsedParams['statusMessage'] = f"{koaid} added to DRP archiving queue"
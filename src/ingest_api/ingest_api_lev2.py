@@ -117,5 +117,7 @@ def update_lev2_parameters(parsedParams, reingest, config, conn, dbUser='koa_tes
         elif result < 1:
             parsedParams['apiStatus'] = 'ERROR'
             parsedParams['ingestErrors'].append('error updating status entries')
+        else:
+            refresh_status_daily(conn, dbUser, instrument, level, utdate)
 
     return parsedParams
@@ -1,26 +1,63 @@
 import os
 import sys
 import calendar
-import time
-import json
+import hashlib
 import logging
+import uuid
 
 from pathlib import Path
-from datetime import datetime, timedelta
+from datetime import datetime
 from flask import Flask, render_template, request, send_from_directory, jsonify
+from flask import Response, make_response
+from flask import g
 from flask_cors import CORS
 
 from ingest_api.ingest_api import ingest_api_get
-from utils.koa_rti_api import KoaRtiApi
+from utils.koa_rti_api import KoaRtiApi, read_headers, STATUS_WATCH
+from utils.koa_rti_cache import LruCache, cache_stats
+from utils.koa_rti_compress import accepted_encoding, compress
+from utils.koa_rti_compress import COMPRESS_MIN_BYTES
 from utils.koa_rti_helpers import get_api_help_string, InstrumentReport
 from utils.koa_rti_helpers import parse_request, parse_results, parse_args
 from utils.koa_rti_helpers import api_results, get_results, year_range
+from utils.koa_rti_helpers import table_cursor
 from utils.koa_tpx_gui import tpx_gui
+from utils.koa_rti_db import close_session
+from utils.koa_rti_json import dumps
 
 
 APP_PATH = os.path.abspath(os.path.dirname(__file__))
 TEMPLATE_PATH = os.path.join(APP_PATH, "templates/")
-API_INSTANCE = None
+
+# the page query of each client,  by the token written into the page
+CLIENT_APIS = LruCache('clients', max_bytes=16 * 1024 * 1024,
+                       max_entries=2000, ttl=12 * 3600)
+CLIENT_COOKIE = 'rti_client'
+# approximate size of a KoaRtiApi instance
+CLIENT_NBYTES = 4096
+
+# table payloads shared by the clients with the same query and version
+RESULT_CACHE = LruCache('table_results', max_bytes=64 * 1024 * 1024,
+                        max_entries=500, ttl=600)
+
+# encoded /koarti_api responses and the compressed table and api responses,
+# by query and content encoding.  Api responses are also keyed by the
+# watermark of their rows,  the same change token as their ETag,  historical
+# ones without a watermark are kept until their TTL.
+RESPONSE_CACHE = LruCache('responses', max_bytes=128 * 1024 * 1024)
+RESPONSE_HISTORICAL_TTL = 3600
+RESPONSE_CURRENT_TTL = 30
+
+# seconds browsers may reuse historical responses without revalidating,
+# current responses are always revalidated with their ETag
+HISTORICAL_MAX_AGE = 3600
+
+# seconds a data-update request waits for a change
+UPDATE_TIMEOUT = 280
+
+# seconds between the data-stream heartbeats,  client reconnect delay (ms)
+STREAM_HEARTBEAT = 15
+STREAM_RETRY = 10000
 
 
 def get_resource_as_string(name, charset='utf-8'):
@@ -40,6 +77,29 @@ cors = CORS(app, resources = {
 app.config['CORS_HEADERS'] = 'Content-Type'
 
 
+@app.after_request
+def add_query_count(response):
+    """
+    Report the number of database statements run for the request.
+    """
+    session = g.get('db_session', None)
+    if session:
+        response.headers['X-DB-Statements'] = str(session.num_queries)
+
+    return response
+
+
+@app.teardown_request
+def close_db_session(error):
+    """
+    Return the request session database connections to the pool.
+    """
+    num_queries = close_session()
+    if num_queries is not None:
+        logging.getLogger('wmko_rti_api').debug(
+            f"{request.path}: {num_queries} database statements")
+
+
 @app.route("/ingest_api", methods=["GET"])
 def ingest_api():
     log.info('ingest_api: starting api call')
@@ -48,21 +108,145 @@ def ingest_api():
 
 @app.route("/koarti_api", methods=['GET'])
 def tpx_rti_api():
-    global API_INSTANCE
     var_get = parse_request(default_utd=False)
     rti_api = KoaRtiApi(var_get)
-    API_INSTANCE = rti_api
 
     if not var_get.search and not var_get.metrics and not var_get.update:
         help_str = f"No Results for query parameters:<BR><BR> {var_get}<BR>"
-        help_str += get_api_help_string(API_INSTANCE)
+        help_str += get_api_help_string(rti_api)
         return help_str
 
-    results = api_results(API_INSTANCE)
-    if var_get.data == 0:
-        del results['data']
+    # answer a matching If-None-Match before running the query
+    token = api_watermark(rti_api)
+    etag, last_modified = api_validators(rti_api, token)
+    historical = rti_api.is_historical()
+    if not_modified(etag):
+        return add_validators(Response(status=304), etag, last_modified,
+                              historical)
+
+    cache_key, ttl = api_cache_key(rti_api, token)
+    body = RESPONSE_CACHE.get((cache_key, None)) if cache_key else None
+    if body is None:
+        results = api_results(rti_api)
+        if var_get.data == 0:
+            del results['data']
+
+        body = dumps(results)
+        if cache_key and results.get('success') == 1:
+            RESPONSE_CACHE.set((cache_key, None), body, len(body), ttl)
+        else:
+            cache_key = None
+
+    response = json_response(body, cache_key=cache_key, ttl=ttl)
+
+    return add_validators(response, etag, last_modified, historical)
+
+
+def api_watermark(api):
+    """
+    The high-water mark of the koa_status rows in the filter of a
+    /koarti_api query,  one indexed query instead of the results.  Only the
+    koa_status searches are validated (see has_watermark).
+
+    :param api: (KoaRtiApi) the API instance of the query
+    :return: (tuple) the watermark,  None if the query is not validated
+    """
+    params = api.get_params()
+    if params.update or params.pykoa or not api.has_watermark():
+        return None
+
+    try:
+        return api.watermark()
+    except Exception:
+        return None
+
+
+def api_validators(api, token):
+    """
+    The ETag of a /koarti_api query from the watermark of its rows.
+
+    :param api: (KoaRtiApi) the API instance of the query
+    :param token: (tuple) the watermark from api_watermark
+    :return: (str, datetime) the ETag and the max last_mod,
+                             None,None if the query is not validated
+    """
+    if token is None:
+        return None, None
+
+    return make_etag('api', api.query_key(), token), token[0]
+
 
-    return jsonify(results)
+def make_etag(*parts):
+    """
+    :return: (str) strong ETag of the change token parts
+    """
+    return hashlib.blake2b(repr(parts).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def not_modified(etag):
+    """
+    Check If-None-Match against the ETag,  also for the tags of the
+    compressed representations (see add_validators).
+
+    :param etag: (str) the current ETag,  None if not validated
+    :return: (bool) True if the client has the current content
+    """
+    if not etag:
+        return False
+
+    return any(request.if_none_match.contains(tag)
+               for tag in (etag, f"{etag}-gzip", f"{etag}-br"))
+
+
+def add_validators(response, etag, last_modified, historical):
+    """
+    Add the ETag,  Last-Modified and Cache-Control headers.  Historical
+    ranges can be reused for HISTORICAL_MAX_AGE,  current ones are always
+    revalidated.
+
+    :param response: (Response) the response
+    :param etag: (str) the ETag,  None to skip the validators
+    :param last_modified: (datetime) the max last_mod of the rows
+    :param historical: (bool) True if the range ends before today
+    :return: (Response) the response
+    """
+    if not etag:
+        return response
+
+    encoding = response.headers.get('Content-Encoding')
+    response.set_etag(f"{etag}-{encoding}" if encoding else etag)
+    if last_modified:
+        response.last_modified = last_modified
+
+    if historical:
+        response.cache_control.max_age = HISTORICAL_MAX_AGE
+    else:
+        response.cache_control.no_cache = True
+
+    return response
+
+
+def api_cache_key(api, token):
+    """
+    The response cache key of a /koarti_api query,  keyed by the watermark
+    of its rows so a cached body always matches its ETag.  Without a
+    watermark only historical ranges are cached,  until their TTL.
+
+    :param api: (KoaRtiApi) the API instance of the query
+    :param token: (tuple) the watermark from api_watermark
+    :return: (tuple, int) the key,  None if not cached,  and its time to live
+    """
+    if api.get_params().update:
+        return None, None
+
+    if token is None:
+        if api.is_historical():
+            return ('api', api.query_key()), RESPONSE_HISTORICAL_TTL
+        return None, None
+
+    ttl = RESPONSE_HISTORICAL_TTL if api.is_historical() else RESPONSE_CURRENT_TTL
+
+    return ('api', api.query_key(), token), ttl
 
 
 @app.route("/koarti", methods=['GET'])
@@ -72,10 +256,12 @@ def tpx_rti_page():
 
     :return: html rendered page
     """
-    global API_INSTANCE
     var_get = parse_request()
     rti_api = KoaRtiApi(var_get)
-    API_INSTANCE = rti_api
+
+    # the query of this page,  used by the table data requests from poll.js
+    client = uuid.uuid4().hex
+    CLIENT_APIS.set(client, rti_api, CLIENT_NBYTES)
 
     db_columns = rti_api.getDbColumns()
     years = year_range()
@@ -89,16 +275,80 @@ def tpx_rti_page():
         results = rti_api.getPlots()
     elif var_get.page in {'koatpx', 'koadrp'}:
         page_name = "tpx_gui.html"
-        results, db_columns = tpx_gui(var_get.page, API_INSTANCE)
+        results, db_columns = tpx_gui(var_get.page, rti_api)
     else:
         # results are loaded by the long-polling routine
         page_name = "rti_table.html"
         results = None
 
-    return render_template(page_name, results=results, params=var_get,
+    page = render_template(page_name, results=results, params=var_get,
                            inst_lists=rti_api.getInstruments(), yrs=years,
                            months=calendar.month_name, db_columns=db_columns,
-                           opt_lists=opt_lists)
+                           opt_lists=opt_lists, client=client)
+
+    response = make_response(page)
+    response.set_cookie(CLIENT_COOKIE, client, samesite='Lax')
+
+    return response
+
+
+def client_api():
+    """
+    The API instance of the page making the request,  found by the client
+    token in the url (written into the page) or the cookie of the last page.
+
+    :return: (KoaRtiApi) None if the page is unknown or expired
+    """
+    client = request.args.get('client') or request.cookies.get(CLIENT_COOKIE)
+    if not client:
+        return None
+
+    return CLIENT_APIS.get(client)
+
+
+def json_response(body, status=200, cache_key=None, ttl=None):
+    """
+    The JSON response,  compressed with the best Accept-Encoding of the
+    request.  With a cache_key the compressed body is kept in RESPONSE_CACHE
+    so repeat requests are not compressed again.
+
+    :param body: (dict/list/bytes) the response,  or the encoded JSON
+    :param status: (int) the HTTP status
+    :param cache_key: (tuple) the key of the encoded body,  None to not cache
+    :param ttl: (int) seconds to keep the compressed body
+    :return: (Response) the application/json response
+    """
+    if not isinstance(body, bytes):
+        body = dumps(body)
+
+    encoding = accepted_encoding(request.headers.get('Accept-Encoding'))
+    if not encoding or len(body) < COMPRESS_MIN_BYTES:
+        response = Response(body, status=status, mimetype='application/json')
+        response.vary.add('Accept-Encoding')
+        return response
+
+    compressed = RESPONSE_CACHE.get((cache_key, encoding)) if cache_key else None
+    if compressed is None:
+        compressed = compress(body, encoding)
+        if cache_key:
+            RESPONSE_CACHE.set((cache_key, encoding), compressed,
+                               len(compressed), ttl)
+
+    response = Response(compressed, status=status, mimetype='application/json')
+    response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+
+    return response
+
+
+def expired_payload():
+    """
+    :return: (Response) tells poll.js to reload the page to register again
+    """
+    return json_response({'results': None,
+                          'columns': None,
+                          'date': datetime.now().strftime('%Y/%m/%d %H:%M:%S'),
+                          'expired': 1})
 
 
 @app.route("/koarti/header/<header_val>", methods=['GET'])
@@ -110,10 +360,7 @@ def return_header(header_val):
 
     :return: html rendered page
     """
-    var_get = parse_request()
-    rti_api = KoaRtiApi(var_get)
-
-    header = rti_api.read_header(header_val)
+    header = read_headers([header_val]).get(header_val, {})
 
     result_dict = {}
     for key, val in header.items():
@@ -135,29 +382,100 @@ def data_update():
     via routines in poll.js.
 
     Returns 'data.txt' content when the resource has  changed after the last
-    request time.
+    request time.  The request sleeps on STATUS_WATCH until the detector sees
+    a change to the rows of its filter or the timeout.
+    """
+    api = client_api()
+    if not api:
+        return expired_payload()
+
+    key = api.watch_key()
+    version = STATUS_WATCH.current(key, api.watermark)
+    new_version = STATUS_WATCH.wait(key, version, UPDATE_TIMEOUT)
+    if new_version == version:
+        return json_response({'results': None,
+                              'columns': None,
+                              'date': datetime.now().strftime('%Y/%m/%d %H:%M:%S')})
+
+    body, cursor, cache_key = table_payload(api, new_version,
+                                            request.args.get('cursor'))
+
+    return json_response(body, cache_key=cache_key, ttl=RESULT_CACHE.ttl)
+
+
+@app.route("/koarti/data-stream")
+def data_stream():
     """
-    while not API_INSTANCE:
-        time.sleep(0.1)
+    Server-Sent Events stream of the daily table,  used by poll.js when the
+    browser supports EventSource.  A 'table' event with the same content as
+    data-update is sent on each change,  with a heartbeat comment in between.
 
-    end_time = datetime.now() + timedelta(seconds=280)
-    request_time = time.time()
-    while not API_INSTANCE.has_changed(request_time):
-        time.sleep(10.0)
-        if datetime.now() > end_time:
-            return {'results': 'null',
-                    'columns': 'null',
-                    'date': datetime.now().strftime('%Y/%m/%d %H:%M:%S')}
+    The event id is the STATUS_WATCH version.  A reconnecting client sends it
+    back as Last-Event-ID (or ?since= from /koarti/data) and is only sent the
+    table if it changed in the meantime.
+    """
+    api = client_api()
+    if not api:
+        # EventSource does not reconnect,  poll.js falls back to long-polling
+        return Response(status=204)
 
-    results, columns = get_results(API_INSTANCE)
+    last_id = request.headers.get('Last-Event-ID', request.args.get('since'))
     try:
-        results = json.dumps(results)
-    except:
-        log.error("ERROR! cannot json.dump data in data_update")
+        version = int(last_id)
+    except (TypeError, ValueError):
+        version = None
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+    key = api.watch_key()
+    current = STATUS_WATCH.current(key, api.watermark)
+    cursor = request.args.get('cursor')
+
+    return Response(table_stream(api, key, version, current, cursor),
+                    mimetype='text/event-stream', headers=headers)
+
+
+def table_stream(api, key, version, current, cursor):
+    """
+    Generate the data-stream events.  The next event is only built when the
+    client has taken the previous one,  so a slow client is sent a single
+    up-to-date delta instead of a queue of every change.
+
+    :param api: (KoaRtiApi) the API instance of the page
+    :param key: (tuple) the STATUS_WATCH filter of the page
+    :param version: (int) the last version the client has,  None for none.
+    :param current: (int) the version of the filter when connected
+    :param cursor: (str) the table_cursor of the rows the client has
+    """
+    yield f"retry: {STREAM_RETRY}\n\n"
+
+    if version is None or version != current:
+        version = current
+        event, cursor = table_event(api, version, cursor)
+        yield event
+
+    while True:
+        new_version = STATUS_WATCH.wait(key, version, STREAM_HEARTBEAT)
+        if new_version == version:
+            yield ": heartbeat\n\n"
+            continue
+
+        version = new_version
+        event, cursor = table_event(api, version, cursor)
+        yield event
+
+
+def table_event(api, version, cursor):
+    """
+    :param api: (KoaRtiApi) the API instance of the page
+    :param version: (int) the STATUS_WATCH version of the table
+    :param cursor: (str) the table_cursor of the rows the client has
+    :return: (str, str) the table as a Server-Sent Event,  the new cursor
+    """
+    body, cursor, cache_key = table_payload(api, version, cursor)
+    event = f"id: {version}\nevent: table\ndata: {body.decode('utf-8')}\n\n"
 
-    return {'results': results,
-            'columns': columns,
-            'date': datetime.now().strftime('%Y/%m/%d %H:%M:%S')}
+    return event, cursor
 
 
 @app.route("/koarti/data")
@@ -166,15 +484,98 @@ def load_data():
     Returns the current data content.  This is used to display the table the
     on initial load.
     """
-    results, columns = get_results(API_INSTANCE)
-    try:
-        results = json.dumps(results)
-    except:
-        log.error("ERROR! cannot json.dump data in load_data")
+    api = client_api()
+    if not api:
+        return expired_payload()
+
+    key = api.watch_key()
+    version = STATUS_WATCH.current(key, api.watermark)
+
+    # the daily table is validated by its STATUS_WATCH version
+    etag = last_modified = None
+    if key:
+        etag = make_etag('table', api.query_key(), version)
+        token = STATUS_WATCH.token(key)
+        last_modified = token[0] if token else None
+
+    historical = api.is_historical()
+    if not_modified(etag):
+        return add_validators(Response(status=304), etag, last_modified,
+                              historical)
+
+    body, cursor, cache_key = table_payload(api, version)
+    response = json_response(body, cache_key=cache_key, ttl=RESULT_CACHE.ttl)
+
+    return add_validators(response, etag, last_modified, historical)
+
+
+def table_payload(api, version, cursor=None):
+    """
+    The table content sent to poll.js.  With a cursor only the rows inserted
+    or modified since are returned (delta=1) to be patched into the table,
+    unless rows can leave the filter of the page (see delta_safe),  then the
+    full table is returned.
+
+    Payloads are shared through RESULT_CACHE by the clients with the same
+    query,  cursor and STATUS_WATCH version,  so the viewers of a page cost
+    one query per change.  Pages without a watch key have no version to
+    invalidate the payload,  they are not cached.
+
+    :param api: (KoaRtiApi) the API instance of the page
+    :param version: (int) the STATUS_WATCH version of the content
+    :param cursor: (str) the table_cursor of the rows the client has
+    :return: (bytes, str, tuple) the JSON of the results,  columns,  date,
+             version and new cursor,  the new cursor,  the cache key or None
+    """
+    delta = 0
+    if cursor and api.delta_safe():
+        try:
+            api = api.with_cursor(cursor)
+            delta = 1
+        except ValueError:
+            cursor = None
+    else:
+        cursor = None
+
+    cache_key = None
+    if api.watch_key() is not None:
+        cache_key = ('table', api.query_key(), version)
+        cached = RESULT_CACHE.get(cache_key)
+        if cached:
+            return cached + (cache_key, )
+
+    results, columns = get_results(api)
+    new_cursor = table_cursor(results, cursor)
+
+    # the rows in the filter,  poll.js reloads the table when a deleted row
+    # leaves it with another number of rows after the delta
+    num_rows = None
+    if delta:
+        token = STATUS_WATCH.token(api.watch_key())
+        num_rows = token[2] if token else None
+
+    body = dumps({'results': results,
+                  'columns': columns,
+                  'date': datetime.now().strftime('%Y/%m/%d %H:%M:%S'),
+                  'version': version,
+                  'cursor': new_cursor,
+                  'delta': delta,
+                  'num_rows': num_rows})
+    if cache_key:
+        RESULT_CACHE.set(cache_key, (body, new_cursor), len(body))
+
+    return body, new_cursor, cache_key
+
+
+@app.route("/koarti/cache-stats")
+def get_cache_stats():
+    """
+    Hit/miss counters and sizes of the RTI caches,  used for monitoring.
+    """
+    stats = cache_stats()
+    stats['watch'] = STATUS_WATCH.stats()
 
-    return {'results': results,
-            'columns': columns,
-            'date': datetime.now().strftime('%Y/%m/%d %H:%M:%S')}
+    return jsonify(stats)
 
 
 @app.route("/koarti/koa_status/reviewed", methods=['PUT'])
@@ -256,6 +657,7 @@ if __name__ == '__main__':
     logdir = args.logdir if mode == 'release' else '/tmp'
     host = '0.0.0.0'
     assert port != 0, "ERROR: Must provide port"
+    STATUS_WATCH.interval = args.watch
 
     #create logger
     create_logger('wmko_rti_api', logdir)
@@ -0,0 +1,175 @@
+'''
+Create the normalized header_keywords(koaid, keyword, value, comment) table
+used by searchHEADER and fill it from the JSON headers table.  The value is
+kept as JSON so it is returned untruncated and with its type,  the comment
+as text.
+
+The headers table is written by the DEP pipeline,  so the index is maintained
+by insert/update/delete triggers on headers that explode the JSON document
+with JSON_TABLE (MySQL 8).  Existing headers are backfilled in KOAID chunks by
+a pool of worker threads,  the expansion runs on the database server so the
+header documents never leave it.
+
+Indexing never rejects a header write: a header that is not a valid JSON
+document has no keywords,  and keywords longer than the keyword column or
+that cannot be used in a JSON path (quotes,  backslashes) are skipped.
+
+Safe to re-run: the table and triggers are only created when missing,  and
+the backfill upserts.  A table from an earlier version (truncated varchar
+values) is dropped and recreated with its triggers,  re-run the backfill.
+
+Example use:
+python migrations/add_header_keywords.py --db koa --chunk 2000 --workers 4
+'''
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_conn import db_conn
+
+
+CREATE_TABLE = '''create table if not exists header_keywords (
+    koaid   varchar(50) not null,
+    keyword varchar(255) not null,
+    value   json null,
+    comment text null,
+    primary key (koaid, keyword),
+    index keyword (keyword)
+)'''
+
+KEYWORD_LENGTH = 255
+
+#one row per keyword of a {keyword: {value:, comment:}} header document,  an
+#invalid document has no keys,  char(34) and char(92) are " and \
+EXPAND_SQL = ('''select {h}.koaid, jt.keyword,
+    json_extract({h}.header, concat('$."', jt.keyword, '".value')),
+    json_unquote(json_extract({h}.header, concat('$."', jt.keyword, '".comment')))
+    from json_table(json_keys(if(json_valid({h}.header), {h}.header, '{{}}')), '$[*]'
+    columns (keyword varchar(1024) path '$' null on error)) jt
+    where jt.keyword is not null and char_length(jt.keyword) <= '''
+              f"{KEYWORD_LENGTH} and instr(jt.keyword, char(34)) = 0 "
+              "and instr(jt.keyword, char(92)) = 0")
+
+UPSERT = ("insert into header_keywords (koaid, keyword, value, comment) {select} "
+          "on duplicate key update value=values(value), comment=values(comment)")
+
+
+def trigger_exists(conn, db, trigger):
+
+    query = ("select count(*) as num from information_schema.triggers "
+             f"where trigger_schema=database() and trigger_name='{trigger}'")
+    return conn.query(db, query, getOne=True, getColumn='num')
+
+
+def value_type(conn, db):
+
+    query = ("select data_type as num from information_schema.columns "
+             "where table_schema=database() and table_name='header_keywords' "
+             "and column_name='value'")
+    return conn.query(db, query, getOne=True, getColumn='num')
+
+
+def add_schema(conn, db):
+    '''
+    Create header_keywords and the triggers that keep it in sync with headers.
+    '''
+
+    #the truncated varchar values cannot be converted to JSON,  rebuild
+    old_type = value_type(conn, db)
+    if old_type and old_type.lower() != 'json':
+        print('dropping the header_keywords table of an earlier version')
+        for name in ('headers_keywords_insert', 'headers_keywords_update',
+                     'headers_keywords_delete'):
+            if trigger_exists(conn, db, name):
+                conn.query(db, f"drop trigger {name}")
+        conn.query(db, "drop table header_keywords")
+
+    conn.query(db, CREATE_TABLE)
+
+    #NEW is a row, not a table, so select it from a one row derived table
+    new_row = EXPAND_SQL.format(h='h').replace(
+        'from json_table', 'from (select NEW.koaid as koaid, NEW.header as header) h, json_table')
+    triggers = {
+        'headers_keywords_insert':
+            f"after insert on headers for each row {UPSERT.format(select=new_row)}",
+        'headers_keywords_update':
+            "after update on headers for each row begin "
+            "delete from header_keywords where koaid=OLD.koaid; "
+            f"{UPSERT.format(select=new_row)}; end",
+        'headers_keywords_delete':
+            "after delete on headers for each row "
+            "delete from header_keywords where koaid=OLD.koaid",
+    }
+    for name, body in triggers.items():
+        if trigger_exists(conn, db, name):
+            continue
+        print(f'adding trigger {name}')
+        conn.query(db, f"create trigger {name} {body}")
+
+
+def koaid_chunks(conn, db, chunk):
+    '''
+    Yield (first, last) KOAID of each chunk of the headers table.  Only the
+    koaid column is read.
+    '''
+
+    last = ''
+    while True:
+        query = (f"select koaid from headers where koaid > '{last}' "
+                 f"order by koaid limit {chunk}")
+        koaids = conn.query(db, query, getColumn='koaid')
+        if not koaids:
+            return
+        yield koaids[0], koaids[-1]
+        last = koaids[-1]
+
+
+def backfill_chunk(conn, db, first, last):
+
+    select = EXPAND_SQL.format(h='headers').replace(
+        'from json_table', 'from headers, json_table')
+    select += f" and headers.koaid >= '{first}' and headers.koaid <= '{last}'"
+    num = conn.query(db, UPSERT.format(select=select))
+    if num is False:
+        print(f'ERROR: backfill failed for {first} - {last}')
+        return 0
+
+    return num
+
+
+def backfill(conn, db, chunk, workers):
+    '''
+    Backfill header_keywords,  each worker thread upserts one chunk at a time.
+    '''
+
+    total = 0
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(backfill_chunk, conn, db, first, last)
+                   for first, last in koaid_chunks(conn, db, chunk)]
+        for i, future in enumerate(futures):
+            total += future.result()
+            print(f'chunk {i + 1}/{len(futures)}, {total} keyword rows, '
+                  f'{time.time() - start:.1f}s')
+
+    return total
+
+
+#===================================== MAiN ===================================
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='create and backfill header_keywords')
+    parser.add_argument('--db', type=str, default='koa', help='database alias in the config file')
+    parser.add_argument('--config', type=str, default='config.live.ini', help='database config file')
+    parser.add_argument('--chunk', type=int, default=2000, help='headers per backfill statement')
+    parser.add_argument('--workers', type=int, default=4, help='parallel backfill connections')
+    parser.add_argument('--backfill-only', action='store_true', help='skip the schema changes')
+    args = parser.parse_args()
+
+    conn = db_conn(args.config)
+    if not args.backfill_only:
+        add_schema(conn, args.db)
+    backfill(conn, args.db, args.chunk, args.workers)
@@ -0,0 +1,131 @@
+'''
+Add the koaid_date column (UT date parsed from the KOAID) to koa_status and
+koa_status_history,  index it and backfill existing rows in id chunks.
+
+Triggers keep koaid_date filled for every new or updated row, including rows
+written by the DEP pipeline,  so the RTI query builder can filter lev1/lev2
+date ranges with one indexed range predicate instead of OR'ed LIKEs.
+
+Safe to re-run: existing columns, indexes and triggers are left in place
+(triggers from before the malformed KOAID guard are replaced) and only rows
+with a NULL koaid_date are backfilled.  Rows with a malformed KOAID keep a
+NULL koaid_date.
+
+Example use:
+python migrations/add_koaid_date.py --db koa --chunk 20000
+'''
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_conn import db_conn
+
+
+#II.YYYYMMDD.SSSSS.SS -> YYYYMMDD,  NULL for a malformed KOAID so strict mode
+#STR_TO_DATE errors never fail the DEP writes through the triggers
+KOAID_DATE_SQL = ("CASE WHEN {koaid} REGEXP '^[^.]+[.][0-9]{{4}}(0[1-9]|1[0-2])(0[1-9]|[12][0-9]|3[01])[.]' THEN "
+                  "STR_TO_DATE(SUBSTRING_INDEX(SUBSTRING_INDEX({koaid}, '.', 2), '.', -1), '%Y%m%d') "
+                  "END")
+TABLES = ('koa_status', 'koa_status_history')
+
+
+def column_exists(conn, db, table, column):
+
+    query = ("select count(*) as num from information_schema.columns "
+             f"where table_schema=database() and table_name='{table}' and column_name='{column}'")
+    return conn.query(db, query, getOne=True, getColumn='num')
+
+
+def index_exists(conn, db, table, index):
+
+    query = ("select count(*) as num from information_schema.statistics "
+             f"where table_schema=database() and table_name='{table}' and index_name='{index}'")
+    return conn.query(db, query, getOne=True, getColumn='num')
+
+
+def trigger_exists(conn, db, trigger):
+
+    query = ("select count(*) as num from information_schema.triggers "
+             f"where trigger_schema=database() and trigger_name='{trigger}'")
+    return conn.query(db, query, getOne=True, getColumn='num')
+
+
+def trigger_guarded(conn, db, trigger):
+
+    query = ("select count(*) as num from information_schema.triggers "
+             f"where trigger_schema=database() and trigger_name='{trigger}' "
+             "and action_statement like '%REGEXP%'")
+    return conn.query(db, query, getOne=True, getColumn='num')
+
+
+def add_schema(conn, db):
+    '''
+    Add the column to both tables, the index and the insert/update triggers to koa_status.
+    '''
+
+    for table in TABLES:
+        if not column_exists(conn, db, table, 'koaid_date'):
+            print(f'adding {table}.koaid_date')
+            conn.query(db, f"alter table {table} add column koaid_date DATE NULL")
+
+    if not index_exists(conn, db, 'koa_status', 'level_koaid_date'):
+        print('adding index koa_status.level_koaid_date')
+        conn.query(db, "alter table koa_status add index level_koaid_date (level, koaid_date)")
+
+    for event in ('insert', 'update'):
+        trigger = f'koa_status_koaid_date_{event}'
+        if trigger_exists(conn, db, trigger):
+            if trigger_guarded(conn, db, trigger):
+                continue
+            #replace the triggers created without the KOAID guard
+            print(f'replacing trigger {trigger}')
+            conn.query(db, f"drop trigger {trigger}")
+        print(f'adding trigger {trigger}')
+        query = (f"create trigger {trigger} before {event} on koa_status for each row "
+                 f"set NEW.koaid_date = {KOAID_DATE_SQL.format(koaid='NEW.koaid')}")
+        conn.query(db, query)
+
+
+def backfill(conn, db, table, chunk, pause):
+    '''
+    Fill koaid_date for existing rows, chunk ids at a time.
+    '''
+
+    row = conn.query(db, f"select min(id) as lo, max(id) as hi from {table}", getOne=True)
+    if not row or row['lo'] is None:
+        return 0
+
+    total = 0
+    koaid_date = KOAID_DATE_SQL.format(koaid='koaid')
+    for lo in range(row['lo'], row['hi'] + 1, chunk):
+        query = (f"update {table} set koaid_date={koaid_date} "
+                 f"where id >= {lo} and id < {lo + chunk} and koaid_date is null")
+        num = conn.query(db, query)
+        if num is False:
+            print(f'ERROR: backfill failed for {table} ids {lo}-{lo + chunk}')
+            continue
+        total += num
+        print(f'{table}: ids {lo}-{lo + chunk - 1}, updated {num} (total {total})')
+        if pause: time.sleep(pause)
+
+    return total
+
+
+#===================================== MAiN ===================================
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='add and backfill koa_status.koaid_date')
+    parser.add_argument('--db', type=str, default='koa', help='database alias in the config file')
+    parser.add_argument('--config', type=str, default='config.live.ini', help='database config file')
+    parser.add_argument('--chunk', type=int, default=10000, help='rows ids per backfill update')
+    parser.add_argument('--pause', type=float, default=0.0, help='seconds to sleep between chunks')
+    parser.add_argument('--backfill-only', action='store_true', help='skip the schema changes')
+    args = parser.parse_args()
+
+    conn = db_conn(args.config)
+    if not args.backfill_only:
+        add_schema(conn, args.db)
+    for table in TABLES:
+        backfill(conn, args.db, table, args.chunk, args.pause)
@@ -0,0 +1,33 @@
+'''
+Add the level_last_mod (level, last_mod) index to koa_status,  used by the
+RTI change detector (KoaRtiApi.watermark) to read MAX(last_mod) of a level
+without scanning the table when the daily page has no date range.
+
+Safe to re-run: an existing index is left in place.
+
+Example use:
+python migrations/add_last_mod_index.py --db koa
+'''
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_conn import db_conn
+from migrations.add_koaid_date import index_exists
+
+
+#===================================== MAiN ===================================
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='add the koa_status last_mod index')
+    parser.add_argument('--db', type=str, default='koa', help='database alias in the config file')
+    parser.add_argument('--config', type=str, default='config.live.ini', help='database config file')
+    args = parser.parse_args()
+
+    conn = db_conn(args.config)
+    if index_exists(conn, args.db, 'koa_status', 'level_last_mod'):
+        print('koa_status.level_last_mod exists')
+    else:
+        conn.query(args.db, 'alter table koa_status add index level_last_mod (level, last_mod)')
+        print('added koa_status.level_last_mod')
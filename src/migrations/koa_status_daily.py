@@ -0,0 +1,91 @@
+'''
+Create and reconcile the koa_status_daily rollup: file counts and summed
+filesize_mb/archsize_mb by (utdate, instrument, level, status), where utdate
+is the KOAID UT date (koa_status.koaid_date, see add_koaid_date.py).
+
+The ingest API refreshes the affected day on each write, but rows written by
+the DEP pipeline are only picked up here,  so run this from cron to rebuild
+the last few days (default) or any date range.
+
+Example use:
+python migrations/koa_status_daily.py --create --start 2020-01-01
+python migrations/koa_status_daily.py --days 3
+'''
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db_conn import db_conn
+from ingest_api.ingest_api_common import STATUS_DAILY_INSERT, query_transaction
+
+
+CREATE_TABLE = '''create table if not exists koa_status_daily (
+    utdate      date not null,
+    instrument  varchar(20) not null,
+    level       tinyint not null,
+    status      varchar(30) not null,
+    num_files   int not null default 0,
+    filesize_mb double not null default 0,
+    archsize_mb double not null default 0,
+    last_mod    timestamp not null default current_timestamp on update current_timestamp,
+    primary key (utdate, instrument, level, status),
+    index level_utdate (level, utdate)
+)'''
+
+
+def rebuild_day(conn, db, utdate):
+    '''
+    Replace the rollup rows of one UT date in one transaction,  readers see
+    the old or the new counts of the day and never an empty day.
+    '''
+
+    queries = [("delete from koa_status_daily where utdate=%s", (utdate,)),
+               (STATUS_DAILY_INSERT.format(where="koaid_date=%s"), (utdate,))]
+    num = query_transaction(conn, db, queries)
+    if num is False:
+        print(f'ERROR: could not rebuild {utdate}')
+        return None
+
+    return num
+
+
+def rebuild(conn, db, start, end):
+    '''
+    Rebuild the rollup one UT date at a time for start <= utdate < end.
+    '''
+
+    day = start
+    while day < end:
+        utdate = day.strftime('%Y-%m-%d')
+        num = rebuild_day(conn, db, utdate)
+        if num is not None:
+            print(f'{utdate}: {num}')
+        day += timedelta(days=1)
+
+
+#===================================== MAiN ===================================
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='create and reconcile koa_status_daily')
+    parser.add_argument('--db', type=str, default='koa', help='database alias in the config file')
+    parser.add_argument('--config', type=str, default='config.live.ini', help='database config file')
+    parser.add_argument('--create', action='store_true', help='create the table if missing')
+    parser.add_argument('--start', type=str, default=None, help='first UT date YYYY-MM-DD')
+    parser.add_argument('--end', type=str, default=None, help='last UT date YYYY-MM-DD, default today')
+    parser.add_argument('--days', type=int, default=3, help='days before end to rebuild without --start')
+    args = parser.parse_args()
+
+    conn = db_conn(args.config)
+    if args.create:
+        conn.query(args.db, CREATE_TABLE)
+
+    end = datetime.strptime(args.end, '%Y-%m-%d') if args.end else datetime.utcnow()
+    end = end.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    if args.start:
+        start = datetime.strptime(args.start, '%Y-%m-%d')
+    else:
+        start = end - timedelta(days=args.days)
+
+    rebuild(conn, args.db, start, end)
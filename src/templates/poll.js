@@ -8,9 +8,22 @@
  * The server is supposed to response when a change has been made on data.
  */
 
+// the token of this page's query on the server
+var gClient = "{{ client }}";
+
+// cursor of the newest rows in the table,  only changed rows are sent after
+var gCursor = null;
+
+function data_url(path) {
+    let url = path + '?client=' + gClient;
+    if (gCursor) url += '&cursor=' + encodeURIComponent(gCursor);
+    return url;
+}
+
 function update() {
+    let url = data_url('/koarti/data-update');
     $.ajax({
-        url: '/koarti/data-update',
+        url: url,
         success:  function(data) {
             write_table(data);
             update();
@@ -20,19 +33,55 @@ function update() {
 }
 
 /**
- * Perform first data request. After taking this data, just query the
- * server and refresh when answered (via update call).
+ * Receive the table updates over one Server-Sent Events connection.  The
+ * browser reconnects on its own and resumes from the last event id,  fall
+ * back to long-polling if EventSource is missing or the stream is refused.
+ * @param version (int) the version of the table already written
+ */
+function listen(version) {
+    if (!window.EventSource) {
+        update();
+        return;
+    }
+
+    let url = data_url('/koarti/data-stream') + '&since=' + version;
+    let source = new EventSource(url);
+    source.addEventListener('table', function(event) {
+        write_table(JSON.parse(event.data));
+    });
+    source.onerror = function() {
+        if (source.readyState === EventSource.CLOSED) {
+            source.close();
+            update();
+        }
+    };
+}
+
+/**
+ * Perform first data request. After taking this data, listen for the
+ * changes on the data-stream (or long-poll via the update call).
  */
 function load() {
     $.ajax({
-        url: '/koarti/data',
+        url: data_url('/koarti/data'),
         success: function(data) {
             write_table(data);
-            update();
+            listen(data.version);
         }
     });
 }
 
+/**
+ * Replace the table with the full current table.
+ */
+function reload_table() {
+    gCursor = null;
+    $.ajax({
+        url: data_url('/koarti/data'),
+        success: write_table
+    });
+}
+
 /**
  * Perform update of koa_status.reviewed.
  */
@@ -98,33 +147,45 @@ function set_checked_reviewed(val, key)
 }
 
 /**
- * Write the table,  only update rows that do not already exist.
+ * Write the table.  A delta only has the inserted or modified rows,  they
+ * replace the rows with the same id or are added to the top of the table.
+ * The server sends the full table when rows can leave the filter.
  * @param data (list:JSON) a list of JSON objects for each row in the table
  */
 function write_table(data) {
-    let results = JSON.parse(data.results);
+    let results = data.results;
     let column = data.columns;
     let num_results = 0;
     var $table = $('#table-body');
 
+    // the server no longer has the query of the page
+    if (data.expired) {
+        window.location.reload(false);
+        return;
+    }
+
+    if (data.cursor) gCursor = data.cursor;
+
+    if (data.delta) {
+        patch_table($table, results, column);
+        // a deleted row is not in the delta,  write the full table
+        let num_rows = $table.children("tr[id^='row']").length;
+        if (data.num_rows != null && num_rows != data.num_rows) reload_table();
+        return;
+    }
+
     if (Boolean(results)) {
         num_results = results.length;
         $table.empty();
     }
 
     for (let i = 0; i < num_results; i++) {
-        $table.append("<tr>");
-        add_row_checkbox($table, results[i]);
-        for (let j = 0; j < column.length; j++) {
-            add_row_col($table, results, column, i, j)
-        }
-        add_row_action_btns($table, results[i]);
-        $table.append("</tr>");
+        $table.append(make_row(results, column, i));
     }
 
-    if (num_results == 0 && column != 'null') {
+    if (num_results == 0 && Boolean(column)) {
         $table.empty();
-        $table.append("<tr>");
+        $table.append("<tr id='no-results'>");
         $table.append("<td></td>");
         for (let j = 0; j < column.length; j++) {
             $table.append("<td> no result </td>");
@@ -139,9 +200,37 @@ function write_table(data) {
     }
 }
 
+/**
+ * Patch the changed rows into the table in place.
+ */
+function patch_table($table, results, column) {
+    if (!Boolean(results)) return;
+
+    $('#no-results').nextAll().addBack().remove();
+    for (let i = results.length - 1; i >= 0; i--) {
+        let $row = make_row(results, column, i);
+        let $old = $('#row' + results[i]['id']);
+        if ($old.length) $old.replaceWith($row);
+        else             $table.prepend($row);
+    }
+
+    if ($('#batch-action').length == 0) add_batch_action_btns($table);
+}
+
+function make_row(results, column, i) {
+    let $row = $("<tr id='row" + results[i]['id'] + "'>");
+    add_row_checkbox($row, results[i]);
+    for (let j = 0; j < column.length; j++) {
+        add_row_col($row, results, column, i, j)
+    }
+    add_row_action_btns($row, results[i]);
+
+    return $row;
+}
+
 function add_batch_action_btns($table)
 {
-    let htm = "<tr><td align='left' colspan=99>with checked: "
+    let htm = "<tr id='batch-action'><td align='left' colspan=99>with checked: "
             + "<input type=button value='review' onclick='set_checked_reviewed(1, \"CBrow\");'> "
             + "<input type=button value='unreview' onclick='set_checked_reviewed(0, \"CBrow\");'>"
             + "</td></tr>";
@@ -0,0 +1,88 @@
+'''
+Benchmark the old LIKE '%YYYY-MM-DD%' date filter against the half-open range
+predicate used by the KoaRtiApi query builder.
+
+Uses an in-memory sqlite table shaped like koa_status with an index on
+utdatetime,  so it runs without access to the KOA database.  The leading
+wildcard forces a full scan in MySQL the same way it does here.
+
+Example use:
+python bench_date_predicates.py --rows 2000000
+'''
+import argparse
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+
+INSTRUMENTS = ['DEIMOS', 'ESI', 'HIRES', 'KCWI', 'LRIS', 'MOSFIRE', 'NIRC2',
+               'NIRES', 'NIRSPEC', 'OSIRIS']
+STATUSES = ['COMPLETE', 'TRANSFERRED', 'PROCESSING', 'ERROR']
+
+
+def build_table(nrows, ndays):
+
+    db = sqlite3.connect(':memory:')
+    db.execute('CREATE TABLE koa_status (id INTEGER PRIMARY KEY, koaid TEXT, '
+               'instrument TEXT, utdatetime TEXT, status TEXT, level INT)')
+
+    start = datetime(2024, 1, 1)
+    span = ndays * 86400
+    rows = []
+    for i in range(nrows):
+        utdatetime = start + timedelta(seconds=random.randrange(span))
+        rows.append((f'HI.{utdatetime:%Y%m%d}.{i % 86400:05}.00',
+                     random.choice(INSTRUMENTS),
+                     utdatetime.strftime('%Y-%m-%d %H:%M:%S'),
+                     random.choice(STATUSES), 0))
+    db.executemany('INSERT INTO koa_status (koaid, instrument, utdatetime, '
+                   'status, level) VALUES (?, ?, ?, ?, ?)', rows)
+    db.execute('CREATE INDEX utdatetime_idx ON koa_status (utdatetime)')
+    db.commit()
+
+    return db
+
+
+def time_query(db, query, params, repeat):
+
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        nrows = len(db.execute(query, params).fetchall())
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+
+    plan = db.execute(f'EXPLAIN QUERY PLAN {query}', params).fetchall()
+    return best, nrows, plan[0][-1]
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--days', type=int, default=730)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f'building koa_status with {args.rows} rows over {args.days} days')
+    db = build_table(args.rows, args.days)
+
+    cases = {
+        'day': ("utdatetime LIKE ?", ('%2024-05-01%',),
+                "utdatetime >= ? AND utdatetime < ?", ('2024-05-01', '2024-05-02')),
+        'month': ("utdatetime LIKE ?", ('%2024-05%',),
+                  "utdatetime >= ? AND utdatetime < ?", ('2024-05-01', '2024-06-01')),
+    }
+
+    print(f"{'case':<8}{'predicate':<8}{'rows':>8}{'best ms':>12}  plan")
+    for name, (like, like_params, rng, rng_params) in cases.items():
+        for label, where, params in (('like', like, like_params),
+                                     ('range', rng, rng_params)):
+            query = f'SELECT * FROM koa_status WHERE {where} AND level=0'
+            best, nrows, plan = time_query(db, query, params, args.repeat)
+            print(f'{name:<8}{label:<8}{nrows:>8}{best * 1000:>12.2f}  {plan}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+'''
+Benchmark the header search done in Python (fetch every header document and
+json.loads it) against extracting and filtering the keywords on the database
+with JSON path functions,  as searchHEADERS does.
+
+Uses an in-memory sqlite table of synthetic FITS headers (sqlite's
+json_extract stands in for MySQL's),  so it runs without the KOA database.
+Rows and bytes are what would cross the wire from the database.
+
+Example use:
+python bench_header_search.py --rows 20000 --keywords 300
+'''
+import argparse
+import json
+import random
+import sqlite3
+import time
+
+
+def make_header(nkeywords):
+
+    header = {f'KEY{i:04}': {'value': random.random() * 1000,
+                             'comment': 'synthetic keyword comment'}
+              for i in range(nkeywords)}
+    header['EXPTIME'] = {'value': random.choice([1, 30, 300, 600, 1200]),
+                         'comment': 'exposure time (s)'}
+    header['TARGNAME'] = {'value': random.choice(['HD 1234', 'M31', 'bias']),
+                          'comment': 'target name'}
+    return json.dumps(header)
+
+
+def build_table(nrows, nkeywords):
+
+    db = sqlite3.connect(':memory:')
+    db.execute('CREATE TABLE headers (koaid TEXT PRIMARY KEY, header TEXT)')
+    db.executemany('INSERT INTO headers VALUES (?, ?)',
+                   ((f'HI.20240501.{i:05}.00', make_header(nkeywords))
+                    for i in range(nrows)))
+    db.commit()
+
+    return db
+
+
+def python_side(db):
+    '''
+    The old searchHEADER approach: transfer every document, decode in python.
+    '''
+
+    rows = db.execute('SELECT koaid, header FROM headers').fetchall()
+    nbytes = sum(len(koaid) + len(header) for koaid, header in rows)
+
+    results = []
+    for koaid, header in rows:
+        header = json.loads(header)
+        exptime = header.get('EXPTIME', {}).get('value')
+        if exptime is None or float(exptime) <= 300:
+            continue
+        results.append({'koaid': koaid, 'exptime': exptime,
+                        'targname': header.get('TARGNAME', {}).get('value')})
+
+    return results, len(rows), nbytes
+
+
+def server_side(db):
+    '''
+    The searchHEADERS approach: extraction and filtering in the database.
+    '''
+
+    query = ('SELECT koaid, json_extract(header, ?) AS exptime, '
+             'json_extract(header, ?) AS targname FROM headers '
+             'WHERE CAST(json_extract(header, ?) AS REAL) > ?')
+    params = ('$."EXPTIME".value', '$."TARGNAME".value', '$."EXPTIME".value', 300)
+    rows = db.execute(query, params).fetchall()
+    nbytes = sum(len(str(col)) for row in rows for col in row)
+
+    results = [{'koaid': koaid, 'exptime': exptime, 'targname': targname}
+               for koaid, exptime, targname in rows]
+
+    return results, len(rows), nbytes
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--keywords', type=int, default=300)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f'building headers with {args.rows} rows of {args.keywords} keywords')
+    db = build_table(args.rows, args.keywords)
+
+    print(f"{'mode':<8}{'results':>9}{'rows sent':>11}{'MB sent':>10}{'best ms':>11}")
+    for name, func in (('python', python_side), ('server', server_side)):
+        best = None
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            results, nrows, nbytes = func(db)
+            elapsed = time.perf_counter() - t0
+            best = elapsed if best is None else min(best, elapsed)
+        print(f'{name:<8}{len(results):>9}{nrows:>11}{nbytes / 1e6:>10.2f}'
+              f'{best * 1000:>11.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+'''
+Benchmark the table JSON encoding: the old path (replace_datetime on every
+cell,  json.dumps of the rows,  then the wrapping dict encoded again with
+the rows as an escaped string) against the single pass koa_rti_json.dumps,
+with orjson when installed and with the stdlib fallback.
+
+Rows are shaped like a koa_status query result,  so it runs without access
+to the KOA database.
+
+Example use:
+python bench_json_encode.py --rows 10000
+'''
+import argparse
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.append('..')
+import utils.koa_rti_json as koa_rti_json
+
+
+INSTRUMENTS = ['DEIMOS', 'ESI', 'HIRES', 'KCWI', 'LRIS', 'MOSFIRE', 'NIRC2',
+               'NIRES', 'NIRSPEC', 'OSIRIS']
+STATUSES = ['COMPLETE', 'TRANSFERRED', 'PROCESSING', 'ERROR']
+TIME_COLUMNS = ['utdatetime', 'creation_time', 'dep_start_time',
+                'dep_end_time', 'xfr_start_time', 'xfr_end_time',
+                'ipac_notify_time', 'ingest_start_time', 'ingest_copy_start_time',
+                'ingest_copy_end_time', 'ingest_end_time', 'ipac_response_time',
+                'stage_time', 'last_mod']
+
+
+def build_rows(nrows):
+
+    start = datetime(2024, 5, 1)
+    rows = []
+    for i in range(nrows):
+        utdatetime = start + timedelta(seconds=random.randrange(86400))
+        row = {'id': i, 'level': 0, 'reviewed': 0,
+               'koaid': f'HI.{utdatetime:%Y%m%d}.{i % 86400:05}.00.fits',
+               'instrument': random.choice(INSTRUMENTS),
+               'status': random.choice(STATUSES), 'status_code': None,
+               'koaimtyp': 'object', 'semid': '2024A_H123',
+               'ofname': f'/sdata/hires/2024may01/hires{i:04}.fits',
+               'stage_dir': '/koadata/HIRES/stage/20240501/lev0',
+               'process_dir': '/koadata/HIRES/20240501/lev0',
+               'archive_dir': '/koadata/HIRES/20240501/lev0',
+               'filesize_mb': Decimal(f'{random.uniform(1, 200):.6f}'),
+               'archsize_mb': Decimal(f'{random.uniform(1, 200):.6f}'),
+               'dep_log': b'dep complete'}
+        for n, column in enumerate(TIME_COLUMNS):
+            row[column] = utdatetime + timedelta(seconds=30 * n)
+        rows.append(row)
+
+    return rows
+
+
+def old_encode(rows, columns):
+    '''replace_datetime (plus the Decimal and bytes that json.dumps rejects),
+    json.dumps,  then Flask encoding the wrapper'''
+
+    for result in rows:
+        for key_name in result:
+            if isinstance(result[key_name], datetime):
+                result[key_name] = result[key_name].strftime("%Y-%m-%d %H:%M:%S")
+            elif isinstance(result[key_name], Decimal):
+                result[key_name] = float(result[key_name])
+            elif isinstance(result[key_name], bytes):
+                result[key_name] = result[key_name].decode()
+
+    results = json.dumps(rows)
+    return json.dumps({'results': results, 'columns': columns,
+                       'date': '2024/05/01 00:00:00'}).encode('utf-8')
+
+
+def new_encode(rows, columns):
+
+    return koa_rti_json.dumps({'results': rows, 'columns': columns,
+                               'date': '2024/05/01 00:00:00'})
+
+
+def time_encode(encode, rows, columns, repeat, copy_rows):
+
+    best = None
+    for _ in range(repeat):
+        # the old path modifies the rows in place
+        data = [dict(row) for row in rows] if copy_rows else rows
+        t0 = time.perf_counter()
+        body = encode(data, columns)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best, len(body)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rows = build_rows(args.rows)
+    columns = list(rows[0].keys())
+
+    cases = [('old', old_encode, True)]
+    if koa_rti_json.orjson:
+        cases.append(('orjson', new_encode, False))
+
+    orjson = koa_rti_json.orjson
+    koa_rti_json.orjson = None
+    try:
+        stdlib = time_encode(new_encode, rows, columns, args.repeat, False)
+    finally:
+        koa_rti_json.orjson = orjson
+
+    print(f'{args.rows} rows')
+    print(f"{'encoder':<10}{'best ms':>10}{'bytes':>12}")
+    for label, encode, copy_rows in cases:
+        best, nbytes = time_encode(encode, rows, columns, args.repeat, copy_rows)
+        print(f'{label:<10}{best * 1000:>10.2f}{nbytes:>12}')
+    print(f"{'stdlib':<10}{stdlib[0] * 1000:>10.2f}{stdlib[1]:>12}")
+
+
+if __name__ == '__main__':
+    main()
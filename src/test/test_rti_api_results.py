@@ -0,0 +1,80 @@
+import unittest
+import sys
+from types import SimpleNamespace
+sys.path.append('..')
+from utils.koa_rti_api import KoaRtiApi
+from utils.koa_rti_helpers import api_results, parse_header_terms
+
+
+class fakeApi:
+    '''the parts of KoaRtiApi used by api_results,  without a database'''
+
+    def __init__(self, **params):
+        args = dict(metrics=None, search=None, update=None, pykoa=None,
+                    progid=None, histogram=None, next=None, val=None,
+                    data=None)
+        args.update(params)
+        self.params = SimpleNamespace(**args)
+        self.limit = 10
+
+    def get_params(self):
+        return self.params
+
+    def get_date_range(self):
+        return '2024-05-01', '2024-05-01'
+
+    def next_token(self, results):
+        return None
+
+    def is_paged(self):
+        return KoaRtiApi.is_paged(self)
+
+    def searchSTATUS(self):
+        KoaRtiApi._page_after(self)
+        return []
+
+    def metricsDEP(self):
+        sums = {'lev0': {'num_files': 12}, 'lev1': {'num_files': 3}}
+        if self.params.data == 0:
+            return {'lev0': [], 'lev1': []}, sums
+        return {'lev0': [{}] * 12, 'lev1': [{}] * 3}, sums
+
+    def searchHEADERS(self):
+        parse_header_terms(self.params.val)
+        return []
+
+
+class apiResultsTestBed(unittest.TestCase):
+
+    def assertError(self, response, msg):
+        self.assertEqual(response['success'], 0)
+        self.assertEqual(response['apiStatus'], 'ERROR')
+        self.assertIn(msg, response['msg'])
+
+    def test_bad_next_token(self):
+        api = fakeApi(search='status', next='not-a-token')
+        self.assertError(api_results(api), 'invalid next token')
+
+    def test_invalid_header_term(self):
+        api = fakeApi(search='headers', val='EXP TIME>3')
+        self.assertError(api_results(api), 'invalid header term')
+
+    def test_header_terms(self):
+        self.assertEqual(parse_header_terms('exptime>300, TARGNAME=HD 1234,AIRMASS'),
+                         [('EXPTIME', '>', '300'), ('TARGNAME', '=', 'HD 1234'),
+                          ('AIRMASS', None, None)])
+        with self.assertRaises(ValueError):
+            parse_header_terms(' , ')
+
+    def test_sums_only_num_files(self):
+        for data in (0, None):
+            response = api_results(fakeApi(metrics='dep', data=data))
+            self.assertEqual(response['num_files'], {'lev0': 12, 'lev1': 3})
+
+    def test_unknown_search(self):
+        api = fakeApi(search='nothing')
+        self.assertEqual(api_results(api)['success'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
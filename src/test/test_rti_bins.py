@@ -0,0 +1,54 @@
+import unittest
+import sys
+sys.path.append('..')
+from utils.koa_rti_bins import bin_time_length, histogram_summary
+
+
+class binTimeLengthTestBed(unittest.TestCase):
+
+    def setUp(self):
+        self.results = {
+            'lev0': [{'instrument': 'HIRES', 'seconds': 2.5},
+                     {'instrument': 'HIRES', 'seconds': 2.9},
+                     {'instrument': 'KCWI', 'seconds': 61.0},
+                     {'instrument': 'HIRES', 'seconds': 259200.0}],
+            'lev1': [{'instrument': 'HIRES', 'seconds': 119.0}],
+        }
+
+    def tally(self, bin_width=1, div=1):
+        '''the original python loop'''
+        stats = {}
+        for level, results in self.results.items():
+            for result in results:
+                inst = f"{result['instrument']}_{level}"
+                tm = int(result['seconds'] / div / bin_width) * bin_width
+                stats.setdefault(inst, {})
+                stats[inst][tm] = stats[inst].get(tm, 0) + 1
+        return stats
+
+    def test_seconds(self):
+        self.assertEqual(bin_time_length(self.results), self.tally())
+
+    def test_minutes(self):
+        stats = bin_time_length(self.results, units='mins')
+        self.assertEqual(stats, self.tally(div=60))
+        self.assertEqual(stats['HIRES_lev0'], {0: 2, 4320: 1})
+
+    def test_bin_width(self):
+        self.assertEqual(bin_time_length(self.results, bin_width=30),
+                         self.tally(bin_width=30))
+
+    def test_empty(self):
+        self.assertEqual(bin_time_length({'lev0': [], 'lev1': []}), {})
+
+    def test_histogram(self):
+        hist = histogram_summary(self.results, bin_width=60)
+        self.assertEqual(hist['HIRES_lev0']['bins'], [0, 259200])
+        self.assertEqual(hist['HIRES_lev0']['counts'], [2, 1])
+        self.assertEqual(hist['HIRES_lev0']['num_files'], 3)
+        self.assertEqual(hist['HIRES_lev1']['percentiles']['p50'], 119.0)
+        self.assertEqual(hist['KCWI_lev0']['bins'], [60])
+
+
+if __name__ == '__main__':
+    unittest.main()
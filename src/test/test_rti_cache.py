@@ -0,0 +1,45 @@
+import unittest
+import sys
+import time
+sys.path.append('..')
+from utils.koa_rti_cache import LruCache, cache_stats
+
+
+class lruCacheTestBed(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = LruCache('test', max_bytes=10)
+
+    def test_evicts_least_recently_used(self):
+        self.cache.set('a', 1, 4)
+        self.cache.set('b', 2, 4)
+        self.cache.get('a')
+        self.cache.set('c', 3, 4)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertEqual(self.cache.get('c'), 3)
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+        self.assertEqual(self.cache.stats()['bytes'], 8)
+
+    def test_too_large_not_cached(self):
+        self.cache.set('big', 'x', 11)
+        self.assertIsNone(self.cache.get('big'))
+
+    def test_ttl_expires(self):
+        self.cache.set('a', {}, 1, ttl=0.01)
+        self.assertEqual(self.cache.get('a'), {})
+        time.sleep(0.02)
+        self.assertEqual(self.cache.get('a', 'missing'), 'missing')
+        self.assertEqual(self.cache.stats()['expired'], 1)
+
+    def test_stats(self):
+        self.cache.set('a', 1, 1)
+        self.cache.get('a')
+        self.cache.get('b')
+        stats = cache_stats()['test']
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
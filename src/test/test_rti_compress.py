@@ -0,0 +1,35 @@
+import gzip
+import unittest
+import sys
+sys.path.append('..')
+import utils.koa_rti_compress as koa_rti_compress
+from utils.koa_rti_compress import accepted_encoding, compress
+
+
+class acceptedEncodingTestBed(unittest.TestCase):
+
+    def test_gzip(self):
+        self.assertEqual(accepted_encoding('gzip, deflate'), 'gzip')
+        self.assertEqual(accepted_encoding('*'), 'gzip')
+
+    def test_none(self):
+        self.assertIsNone(accepted_encoding(None))
+        self.assertIsNone(accepted_encoding('identity'))
+        self.assertIsNone(accepted_encoding('gzip;q=0'))
+
+    def test_brotli_preferred(self):
+        brotli = koa_rti_compress.brotli
+        koa_rti_compress.brotli = object()
+        try:
+            self.assertEqual(accepted_encoding('gzip, deflate, br'), 'br')
+            self.assertEqual(accepted_encoding('gzip, br;q=0.5'), 'gzip')
+        finally:
+            koa_rti_compress.brotli = brotli
+
+    def test_compress(self):
+        body = b'{"results":[]}' * 100
+        self.assertEqual(gzip.decompress(compress(body, 'gzip')), body)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+import sys
+sys.path.append('..')
+from test_rti_paging import make_api
+
+
+class headerSearchTestBed(unittest.TestCase):
+
+    def test_value_types(self):
+        comment = 'a long HISTORY entry ' * 20
+        api = make_api(search='header', val='EXPTIME')
+        api.db_functions.rows = [
+            {'koaid': 'HI.20240501.00001.fits', 'header_value': '300.5',
+             'header_comment': 'exposure time'},
+            {'koaid': 'HI.20240501.00002.fits', 'header_value': '"%s"' % comment,
+             'header_comment': None},
+            {'koaid': 'HI.20240501.00003.fits', 'header_value': 'true',
+             'header_comment': None},
+            {'koaid': 'HI.20240501.00004.fits', 'header_value': None,
+             'header_comment': None}]
+
+        results = api.searchHEADER()
+
+        self.assertEqual([row['header_value'] for row in results],
+                         [300.5, comment, True, None])
+        self.assertEqual(results[0]['header_keyword'], 'EXPTIME')
+
+        query, params = api.db_functions.queries[-1]
+        self.assertIn('hk.keyword = %s', query)
+        self.assertEqual(params[0], 'EXPTIME')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import json
+import unittest
+import sys
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+sys.path.append('..')
+import utils.koa_rti_json as koa_rti_json
+from utils.koa_rti_json import dumps, encode_value
+
+
+class encodeValueTestBed(unittest.TestCase):
+
+    def test_datetime(self):
+        self.assertEqual(encode_value(datetime(2024, 5, 1, 6, 7, 8)),
+                         '2024-05-01 06:07:08')
+        self.assertEqual(encode_value(datetime(2024, 5, 1, 6, 7, 8, 90)),
+                         '2024-05-01 06:07:08')
+
+    def test_date(self):
+        # same as the http_date of Flask's jsonify
+        self.assertEqual(encode_value(date(2024, 1, 1)),
+                         'Mon, 01 Jan 2024 00:00:00 GMT')
+
+    def test_other_types(self):
+        self.assertEqual(encode_value(Decimal('1.5')), 1.5)
+        self.assertEqual(encode_value(timedelta(minutes=2)), 120.0)
+        self.assertEqual(encode_value(b'dep complete'), 'dep complete')
+        with self.assertRaises(TypeError):
+            encode_value(object())
+
+    def test_dumps(self):
+        row = {'utdate': date(2024, 5, 1), 'last_mod': datetime(2024, 5, 1),
+               'filesize_mb': Decimal('2.25')}
+        expected = {'utdate': 'Wed, 01 May 2024 00:00:00 GMT',
+                    'last_mod': '2024-05-01 00:00:00', 'filesize_mb': 2.25}
+        self.assertEqual(json.loads(dumps({'results': [row]})),
+                         {'results': [expected]})
+
+        orjson = koa_rti_json.orjson
+        koa_rti_json.orjson = None
+        try:
+            self.assertEqual(json.loads(dumps({'results': [row]})),
+                             {'results': [expected]})
+        finally:
+            koa_rti_json.orjson = orjson
+
+
+if __name__ == '__main__':
+    unittest.main()
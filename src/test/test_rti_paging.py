@@ -0,0 +1,111 @@
+import unittest
+import sys
+from collections import namedtuple
+from datetime import datetime
+from unittest import mock
+sys.path.append('..')
+import utils.koa_rti_api as koa_rti_api
+from utils.koa_rti_api import KoaRtiApi
+from utils.koa_rti_helpers import api_results
+
+# the parse_request parameters
+PARAMS = ['utd', 'utd2', 'search', 'update', 'metrics', 'pykoa', 'val',
+          'view', 'tel', 'inst', 'page', 'yr', 'month', 'limit', 'chk',
+          'chk1', 'obsid', 'progid', 'plot', 'columns', 'key', 'add',
+          'level', 'data', 'update_val', 'histogram', 'bin', 'units', 'next']
+
+
+class stubDb:
+    '''records the queries instead of running them'''
+
+    def __init__(self):
+        self.queries = []
+        self.rows = []
+
+    def make_query(self, query, params, db_name=None):
+        self.queries.append((query, params))
+        return self.rows
+
+
+def make_api(**kwargs):
+    args = dict.fromkeys(PARAMS)
+    args.update(view=0, tel=0, page='daily', month='05')
+    args.update(kwargs)
+    params = namedtuple('params', args.keys())(*args.values())
+    with mock.patch.object(koa_rti_api, 'DatabaseInteraction', stubDb):
+        return KoaRtiApi(params)
+
+
+class pagingTestBed(unittest.TestCase):
+
+    def setUp(self):
+        self.rows = [{'id': 12, 'utdatetime': datetime(2024, 5, 1, 6, 7, 8)},
+                     {'id': 11, 'utdatetime': datetime(2024, 5, 1, 6, 7, 8)}]
+
+    def test_round_trip(self):
+        # ids of different lengths exercise the stripped base64 padding
+        for row_id in (1, 12, 123, 1234):
+            self.rows[-1]['id'] = row_id
+            token = make_api(search='status', limit=2).next_token(self.rows)
+            self.assertNotIn('=', token)
+
+            api = make_api(search='status', limit=2, next=token)
+            self.assertEqual(api._page_after(), ('2024-05-01 06:07:08', row_id))
+
+    def test_round_trip_null_utdatetime(self):
+        self.rows[-1]['utdatetime'] = None
+        token = make_api(search='status', limit=2).next_token(self.rows)
+        api = make_api(search='status', limit=2, next=token)
+        self.assertEqual(api._page_after(), (None, 11))
+
+    def test_short_page(self):
+        api = make_api(search='status', limit=3)
+        self.assertIsNone(api.next_token(self.rows))
+        self.assertIsNone(make_api(search='status').next_token(self.rows))
+
+    def test_page_query(self):
+        token = make_api(search='status', limit=2).next_token(self.rows)
+        api = make_api(search='status', val='ERROR', limit=2, next=token)
+        api.searchSTATUS()
+
+        query, params = api.db_functions.queries[-1]
+        self.assertIn("(koa_status.utdatetime < %s OR (koa_status.utdatetime "
+                      "= %s AND koa_status.id < %s) OR koa_status.utdatetime "
+                      "IS NULL)", query)
+        self.assertTrue(query.endswith(
+            " ORDER BY utdatetime DESC, koa_status.id DESC LIMIT %s"))
+        self.assertEqual(params[-4:], ('2024-05-01 06:07:08',
+                                       '2024-05-01 06:07:08', 11, 2))
+
+    def test_page_query_null_utdatetime(self):
+        self.rows[-1]['utdatetime'] = None
+        token = make_api(search='status', limit=2).next_token(self.rows)
+        api = make_api(search='status', val='ERROR', limit=2, next=token)
+        api.searchSTATUS()
+
+        query, params = api.db_functions.queries[-1]
+        self.assertIn("(koa_status.utdatetime IS NULL AND koa_status.id < %s)",
+                      query)
+        self.assertEqual(params[-2:], (11, 2))
+
+    def test_first_page(self):
+        api = make_api(search='status', val='ERROR', limit=2)
+        api.searchSTATUS()
+
+        query, params = api.db_functions.queries[-1]
+        self.assertNotIn('koa_status.id <', query)
+        self.assertIn(" ORDER BY utdatetime DESC, koa_status.id DESC", query)
+
+    def test_not_paged(self):
+        api = make_api(search='lev1', limit=2)
+        self.assertFalse(api.is_paged())
+        self.assertIsNone(api.next_token(self.rows))
+
+        for search in ('lev1', 'koatpx', 'koadrp', 'statuscount'):
+            response = api_results(make_api(search=search, limit=2, next='x'))
+            self.assertEqual(response['success'], 0)
+            self.assertIn('next is not supported', response['msg'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+import sys
+import time
+sys.path.append('..')
+from utils.koa_rti_watch import ChangeWatcher
+
+
+class changeWatcherTestBed(unittest.TestCase):
+
+    def setUp(self):
+        self.values = {'a': 0, 'b': 0}
+        self.calls = {'a': 0, 'b': 0}
+        self.watch = ChangeWatcher('test_watch', interval=0.01)
+
+    def check(self, key):
+        def check_key():
+            self.calls[key] += 1
+            return self.values[key]
+        return check_key
+
+    def test_wakes_on_change(self):
+        version = self.watch.current('a', self.check('a'))
+        self.values['a'] = 1
+        start = time.monotonic()
+        self.assertGreater(self.watch.wait('a', version, 5), version)
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_other_filter_not_woken(self):
+        version_a = self.watch.current('a', self.check('a'))
+        self.watch.current('b', self.check('b'))
+        self.values['b'] = 1
+        self.assertEqual(self.watch.wait('a', version_a, 0.1), version_a)
+
+    def test_one_check_per_filter(self):
+        versions = [self.watch.current('a', self.check('a')) for i in range(5)]
+        self.assertEqual(versions, [versions[0]] * 5)
+        self.assertEqual(self.calls['a'], 1)
+        time.sleep(0.1)
+        self.assertLess(self.calls['a'], 20)
+
+    def test_versions_not_reused(self):
+        version = self.watch.current('a', self.check('a'))
+        self.watch.filters.clear()
+        self.assertNotEqual(self.watch.current('a', self.check('a')), version)
+
+    def test_unwatched(self):
+        self.assertEqual(self.watch.current(None, self.check('a')), 0)
+        self.assertEqual(self.watch.wait(None, 0, 0.01), 0)
+        self.assertEqual(self.watch.stats()['filters'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
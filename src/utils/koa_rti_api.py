@@ -1,13 +1,63 @@
+import base64
+import copy
 import json
+import threading
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import os
-from os import stat
 
-from utils.koa_rti_helpers import query_prefix, date_iter
+from utils.koa_rti_helpers import query_prefix, date_iter, date_predicate
+from utils.koa_rti_helpers import date_bounds, parse_header_terms
+from utils.koa_rti_helpers import header_term_query
 from utils.koa_rti_pykoa import PyKoaApi
 from utils.koa_rti_db import DatabaseInteraction
-from utils.koa_rti_plots import TimeBarPlot, OverlayTimePlot
+from utils.koa_rti_plots import TimeBarPlot, OverlayTimePlot, embed_plots
+from utils.koa_rti_cache import LruCache, activity_version
+from utils.koa_rti_bins import bin_time_length, histogram_summary
+from utils.koa_rti_bins import UNIT_SECONDS
+from utils.koa_rti_watch import ChangeWatcher
+
+# parsed FITS headers by KOAID,  headers do not change after ingest.  Missing
+# KOAIDs are cached briefly since the header may still be ingested.
+HEADER_CACHE = LruCache('headers', max_bytes=64 * 1024 * 1024)
+HEADER_MISSING_TTL = 60
+
+# days before today still read from koa_status instead of koa_status_daily
+ROLLUP_LAG_DAYS = 2
+
+# the start and end time columns of each metrics command
+METRICS_TIMES = {
+    'PROCESS': ('creation_time', 'process_end_time'),
+    'TRANSFER': ('xfr_start_time', 'xfr_end_time'),
+    'INGEST': ('ingest_start_time', 'ingest_end_time'),
+    'COPYINGEST': ('ingest_copy_start_time', 'ingest_copy_end_time'),
+    'DRP': ('lev0.process_end_time', 'lev1.creation_time'),
+    'TOTAL': ('creation_time', 'ingest_end_time'),
+}
+
+# the searches reading only the koa_status rows of _generic_query,  the rows
+# of their results are in the watermark filter
+WATERMARK_SEARCHES = {'DATE', 'LASTENTRY', 'STATUS', 'STATUSCODE', 'KOAID',
+                      'SEMID', 'IMAGETYPE', 'GENERAL'}
+
+# the searches limited and ordered by _add_general_query,  pageable with a
+# next token
+PAGED_SEARCHES = {'DATE', 'STATUS', 'STATUSCODE', 'KOAID', 'SEMID',
+                  'IMAGETYPE', 'GENERAL', 'HEADER', 'HEADERS'}
+
+# rendered metrics plots,  ranges ending before today are effectively
+# immutable.  Current ranges expire or are dropped on new ingest activity.
+PLOT_CACHE = LruCache('plots', max_bytes=32 * 1024 * 1024, max_entries=200)
+PLOT_HISTORICAL_TTL = 24 * 3600
+PLOT_CURRENT_TTL = 300
+
+# plots are computed on threads shared by all requests,  one page uses at
+# most PLOT_PAGE_WORKERS of them at a time.
+PLOT_WORKERS = 4
+PLOT_PAGE_WORKERS = 3
+PLOT_EXECUTOR = None
+PLOT_EXECUTOR_LOCK = threading.Lock()
 
 
 class KoaRtiApi:
@@ -57,6 +107,8 @@ class KoaRtiApi:
         self.update_val = var_get.update_val
         self.params = var_get
         self.limit = var_get.limit
+        # (last_mod, id) to only return the rows changed since,  see with_cursor
+        self.cursor = None
         self.utd = var_get.utd
 
         self.table_view = None
@@ -92,6 +144,18 @@ class KoaRtiApi:
         """
         return self.params
 
+    def is_historical(self):
+        """
+        Determine if the date range ends before the current UT date,  the
+        results of historical ranges only change on reprocessing.
+
+        :return: (bool) True if the range ends before today.
+        """
+        bounds = date_bounds(self.utd, self.params.utd2) if self.utd else None
+        today = datetime.utcnow().strftime('%Y-%m-%d')
+
+        return bool(bounds) and bounds[1] <= today
+
     def is_daily(self):
         """
         Determine if the query / page is the daily page.
@@ -144,6 +208,39 @@ class KoaRtiApi:
 
         return self.db_functions.make_query(query, params)
 
+    def searchSTATUSCOUNT(self):
+        """
+        Number of files and summed sizes by UT date,  instrument,  level and
+        status from the koa_status_daily rollup.
+
+        :return: (list) row/columns to be used for the table.
+        """
+        self.query_keys = ['UTDATE', 'INSTRUMENT', 'LEVEL', 'STATUS',
+                           'NUM_FILES', 'FILESIZE_MB', 'ARCHSIZE_MB']
+
+        query = "SELECT utdate, instrument, level, status, num_files, "
+        query += "filesize_mb, archsize_mb FROM koa_status_daily "
+        query += "WHERE num_files > 0"
+        params = ()
+
+        if self.utd:
+            date_query, params = date_predicate('utdate', self.utd,
+                                                self.params.utd2)
+            query += f" AND {date_query}"
+
+        if self.params.level is not None:
+            query += " AND level=%s"
+            params += (int(self.params.level), )
+
+        if self.search_val:
+            query += " AND status LIKE %s"
+            params += ("%" + str(self.search_val) + "%", )
+
+        query, params = self._add_inst_query(query, params)
+        query += " ORDER BY utdate, instrument, level, status"
+
+        return self.db_functions.make_query(query, params)
+
     def searchSTATUSCODE(self):
         """
         Find all results with a certain status.
@@ -185,36 +282,78 @@ class KoaRtiApi:
         return self.db_functions.make_query(query, params)
 
     def searchHEADER(self):
+        """
+        Find the value and comment of a header keyword (val) for the files.
+        The keyword is looked up in the header_keywords index so the header
+        documents are not transferred or parsed.
+
+        Several keywords and comparisons,  ie val=EXPTIME>300,TARGNAME use
+        searchHEADERS.
+
+        :return: (list) row/columns to be used for the table.
+        """
+        terms = parse_header_terms(self.search_val)
+        if len(terms) > 1 or terms[0][1]:
+            return self.searchHEADERS(terms)
+
         self.query_keys = ['KOAID', 'STATUS', 'HEADER_KEYWORD', 'HEADER_VALUE',
                            'HEADER_COMMENT', 'INSTRUMENT', 'KOAIMTYP', 'SEMID',
                            'LAST_MOD', 'STAGE_FILE']
-        params = ()
-        query = "SELECT headers.*, status, stage_file, instrument, koaimtyp, "
-        query += "semid FROM headers JOIN koa_status ON headers.koaid"
-        query += " = koa_status.koaid"
+        params = (self.search_val, )
+        query = "SELECT headers.koaid, hk.value AS header_value, "
+        query += "hk.comment AS header_comment, koa_status.last_mod, status, "
+        query += "stage_file, instrument, koaimtyp, semid, koa_status.id, "
+        query += "koa_status.utdatetime FROM headers "
+        query += "JOIN koa_status ON headers.koaid = koa_status.koaid "
+        query += "LEFT JOIN header_keywords hk ON hk.koaid = headers.koaid "
+        query += "AND hk.keyword = %s"
 
         query, params = self._add_general_query(query, params, "WHERE")
         results = self.db_functions.make_query(query, params)
 
-        for i, result in enumerate(results):
-            result['last_mod'] = result.get('last_mod', None)
+        for result in results:
+            # the JSON value,  decoded to its type
+            value = result.get('header_value')
+            if isinstance(value, (str, bytes)):
+                result['header_value'] = json.loads(value)
             result['header_keyword'] = self.search_val
-
-            header = result.get('header', None)
-            result['header_value'] = None
-            result['header_comment'] = None
-            if header:
-                head_dict = json.loads(header)
-                head_vals = head_dict.get(self.search_val, None)
-                if head_vals:
-                    result['header_value'] = head_vals.get('value', None)
-                    result['header_comment'] = head_vals.get('comment', None)
-
             result['header'] = None
-            results[i] = result
 
         return results
 
+    def searchHEADERS(self, terms=None):
+        """
+        Return header keyword values for the files matching all comparisons,
+        ie val=EXPTIME>300,TARGNAME=HD 1234,AIRMASS.  Extraction and filtering
+        are done on the database,  only the requested keywords are returned.
+
+        :param terms: (list) parsed keyword terms,  default is from val.
+
+        :return: (list) row/columns to be used for the table.
+        """
+        if not terms:
+            terms = parse_header_terms(self.search_val)
+
+        self.query_keys = ['KOAID', 'STATUS'] + [term[0] for term in terms]
+        self.query_keys += ['INSTRUMENT', 'KOAIMTYP', 'SEMID', 'LAST_MOD',
+                            'STAGE_FILE']
+
+        columns, params, where, where_params = header_term_query(terms)
+        query = f"SELECT headers.koaid, {columns}, koa_status.last_mod, status, "
+        query += "stage_file, instrument, koaimtyp, semid, koa_status.id, "
+        query += "koa_status.utdatetime FROM headers "
+        query += "JOIN koa_status ON headers.koaid = koa_status.koaid"
+
+        add_str = "WHERE"
+        if where:
+            query += f" WHERE {where}"
+            params += where_params
+            add_str = " AND "
+
+        query, params = self._add_general_query(query, params, add_str)
+
+        return self.db_functions.make_query(query, params)
+
     def searchKOATPX(self):
         """
         Find all results for the TPX GUI.
@@ -271,6 +410,17 @@ class KoaRtiApi:
 
         :return: [{results}] array of DB search results
         """
+        query, params = self._lev1_select(columns)
+        results = self._lev1_query(query, params)
+
+        return results
+
+    def _lev1_select(self, columns=None):
+        """
+        The lev1 (DRP) files query used by searchLEV1.
+
+        :return: (str, tuple) query string and escaped parameters for query
+        """
         if not columns:
             columns = self.params.columns
         query, params, add_str = query_prefix(
@@ -288,31 +438,30 @@ class KoaRtiApi:
             add_str = "AND"
 
         query = self._add_koaid_daterange(query, 'koaid', add_str)
-        results = self._lev1_query(query, params)
 
-        return results
+        return query, params
 
     def _add_koaid_daterange(self, query, val, add_str):
-        if not self.utd:
-            return query
-
-        utd2 = self.params.utd2
-        if self.utd and not utd2:
-            utd2 = self.utd
-
-        current_date = datetime.strptime(self.utd, '%Y-%m-%d')
-        end_date = datetime.strptime(utd2, '%Y-%m-%d')
+        """
+        Limit the query to KOAIDs in the utd - utd2 date range with the
+        indexed koaid_date column (UT date derived from the KOAID).
 
-        date_str = current_date.strftime('%Y%m%d')
-        query += f" {add_str} ({val} LIKE '%{date_str}%'"
+        :param query: (str) the query to add to
+        :param val: (str) the koaid column,  ie koaid or lev1.koaid
+        :param add_str: (str) the query conjunction.
 
+        :return: (str) the new query
+        """
+        if not self.utd:
+            return query
 
-        while current_date < end_date:
-            date_str = current_date.strftime('%Y%m%d')
-            current_date += timedelta(days=1)
-            query += f" OR {val} LIKE '%{date_str}%'"
+        bounds = date_bounds(self.utd, self.params.utd2)
+        if not bounds:
+            raise ValueError(f"invalid date range: {self.utd} - {self.params.utd2}")
 
-        query += ")"
+        date_col = f"{val}_date"
+        query += f" {add_str} ({date_col} >= '{bounds[0]}'"
+        query += f" AND {date_col} < '{bounds[1]}')"
 
         return query
 
@@ -427,9 +576,9 @@ class KoaRtiApi:
 
         :return: (str) comma separated instruments
         """
+        date_query, params = date_predicate('utdatetime', day)
         query = f'SELECT DISTINCT instrument FROM koa_status '
-        query += f'WHERE utdatetime LIKE %s AND level=0'
-        params = ("%" + day + "%", )
+        query += f'WHERE {date_query} AND level=0'
 
         if self.params.inst:
             query += f' AND instrument LIKE %s'
@@ -496,7 +645,7 @@ class KoaRtiApi:
 
         :return: [{koaid, instrument, seconds}]
         """
-        stats, sums = self._get_time_diff('creation_time', 'process_end_time')
+        stats, sums = self._get_time_diff(*METRICS_TIMES['PROCESS'])
 
         return stats, sums
 
@@ -506,7 +655,7 @@ class KoaRtiApi:
 
         :return: [{koaid, instrument, seconds}]
         """
-        stats, sums = self._get_time_diff('xfr_start_time', 'xfr_end_time')
+        stats, sums = self._get_time_diff(*METRICS_TIMES['TRANSFER'])
 
         return stats, sums
 
@@ -516,7 +665,7 @@ class KoaRtiApi:
 
         :return: [{koaid, instrument, seconds}]
         """
-        stats, sums = self._get_time_diff('ingest_start_time', 'ingest_end_time')
+        stats, sums = self._get_time_diff(*METRICS_TIMES['INGEST'])
 
         return stats, sums
 
@@ -526,7 +675,7 @@ class KoaRtiApi:
 
         :return: [{koaid, instrument, seconds}]
         """
-        stats, sums = self._get_time_diff('ingest_copy_start_time', 'ingest_copy_end_time')
+        stats, sums = self._get_time_diff(*METRICS_TIMES['COPYINGEST'])
 
         return stats, sums
 
@@ -537,7 +686,7 @@ class KoaRtiApi:
 
         :return:
         """
-        stats, sums = self._get_time_diff('lev0.process_end_time', 'lev1.creation_time')
+        stats, sums = self._get_time_diff(*METRICS_TIMES['DRP'])
 
         return stats, sums
 
@@ -547,19 +696,43 @@ class KoaRtiApi:
 
         :return: [{koaid, instrument, seconds}]
         """
-        stats, sums = self._get_time_diff('creation_time', 'ingest_end_time')
+        stats, sums = self._get_time_diff(*METRICS_TIMES['TOTAL'])
 
         return stats, sums
 
+    def get_histogram(self, cmd):
+        """
+        Binned times of a metrics command by instrument and level,
+        ie /koarti_api?metrics=TOTAL&histogram=1&bin=60
+
+        :param cmd: (str) the metrics command,  ie TOTAL
+        :return: (dict, dict) histograms by instrument_level,  sums by level
+        """
+        if cmd not in METRICS_TIMES:
+            raise ValueError(f"no histogram for metrics={cmd}")
+
+        units = self.params.units if self.params.units else None
+        if units not in UNIT_SECONDS:
+            raise ValueError("units must be one of s, mins, hrs")
+
+        bin_width = self.params.bin if self.params.bin else 1
+        if type(bin_width) != int or bin_width < 1:
+            raise ValueError("bin must be a positive integer")
+
+        results_dict, sums = self._get_time_diff(*METRICS_TIMES[cmd],
+                                                 sums_only=False)
+        histogram = histogram_summary(results_dict, bin_width, units)
+
+        return histogram, sums
+
     """  ------------  metrics Plots section  ------------  """
     def statIpacTime(self):
         units = None
         if self.level == 2:
-            stats = self._bin_time_length('lev2.creation_time',
-                                          'lev2.ipac_response_time')
-            for ky in stats.keys():
-                stats[ky] = self._sec_to_mins(stats[ky])
             units = 'mins'
+            stats = self._bin_time_length('lev2.creation_time',
+                                          'lev2.ipac_response_time',
+                                          units=units)
             xrange = 1440
         else:
             stats = self._bin_time_length('lev1.creation_time',
@@ -574,10 +747,9 @@ class KoaRtiApi:
     def statDrpTime(self):
         units = None
         if self.level == 2:
-            stats = self._bin_time_length('lev0.process_end_time', 'lev2.creation_time')
-            for ky in stats.keys():
-                stats[ky] = self._sec_to_mins(stats[ky])
             units = 'mins'
+            stats = self._bin_time_length('lev0.process_end_time',
+                                          'lev2.creation_time', units=units)
             xrange = 1440
         else:
             stats = self._bin_time_length('lev0.process_end_time', 'lev1.creation_time')
@@ -619,52 +791,245 @@ class KoaRtiApi:
         return plot_obj.get_plot()
 
     def getPlots(self):
-        """ Determine the plots to return by the input plot type """
+        """
+        Determine the plots to return by the input plot type,  served from
+        PLOT_CACHE when the same plots were made recently.
+        """
+        key, ttl = self._plot_cache_key()
+        results = PLOT_CACHE.get(key)
+        if results is not None:
+            return results
+
+        results = self._make_plots()
+
+        nbytes = len(results['script']) + len(results['resources'])
+        nbytes += sum(len(div) for div in results['plots'] if div)
+        PLOT_CACHE.set(key, results, nbytes, ttl=ttl)
+
+        return results
+
+    def _plot_cache_key(self):
+        """
+        The normalized plot parameters and the cache time to live.  Ranges
+        that include today also depend on the ingest activity version.
+
+        :return: (tuple, int) the cache key,  seconds to keep the plots
+        """
+        plot = self.params.plot or 0
+        if plot not in range(0, 6):
+            plot = 'all'
+        level = int(self.level) if self.level is not None else None
+        inst = str(self.params.inst).upper() if self.params.inst else None
+
+        key = ('plots', plot, level, inst, self.utd, self.params.utd2,
+               self.params.tel or 0)
+
+        if self.is_historical():
+            return key, PLOT_HISTORICAL_TTL
+
+        return key + (activity_version(), ), PLOT_CURRENT_TTL
+
+    def _make_plots(self, workers=None):
+        """
+        Make the plots for the input plot type.  The independent plots are
+        computed concurrently and returned in order.
+
+        :param workers: (int) max plots computed at once,
+                        default is PLOT_PAGE_WORKERS
+        """
         if not self.params.plot or self.params.plot == 0:
-            results = {'plots': [self.statTotalTime()]}
+            stats = [self.statTotalTime]
         elif self.params.plot == 1:
-            results = {'plots': [self.statProcessTime()]}
+            stats = [self.statProcessTime]
         elif self.params.plot == 2:
-            results = {'plots': [self.statTransferTime()]}
+            stats = [self.statTransferTime]
         elif self.params.plot == 3:
-            results = {'plots': [self.statIngestTime()]}
+            stats = [self.statIngestTime]
         elif self.params.plot == 4:
-            results = {'plots': [self.statDrpTime()]}
+            stats = [self.statDrpTime]
         elif self.params.plot == 5:
-            results = {'plots': [self.statIpacTime()]}
+            stats = [self.statIpacTime]
         else:
-            results = {'plots': [self.statTotalTime(), self.statProcessTime(),
-                                 self.statTransferTime(), self.statIngestTime()]}
+            stats = [self.statTotalTime, self.statProcessTime,
+                     self.statTransferTime, self.statIngestTime]
 
             if self.level >= 1:
-                results['plots'].append(self.statDrpTime())
+                stats.append(self.statDrpTime)
 
-        return results
+        return embed_plots(self._run_stats(stats, workers))
+
+    def _run_stats(self, stats, workers=None):
+        """
+        Run the stat functions on the shared plot threads,  at most workers
+        at a time.
+
+        :param stats: (list) stat functions returning a plot
+        :param workers: (int) max concurrent stats,  default PLOT_PAGE_WORKERS
+
+        :return: (list) the plots in the order of stats
+        """
+        if workers is None:
+            workers = PLOT_PAGE_WORKERS
+        if len(stats) < 2 or workers < 2:
+            return [stat() for stat in stats]
+
+        gate = threading.BoundedSemaphore(workers)
+        futures = []
+        for stat in stats:
+            gate.acquire()
+            future = plot_executor().submit(stat)
+            future.add_done_callback(lambda done: gate.release())
+            futures.append(future)
+
+        return [future.result() for future in futures]
 
     """  ------------  Helpers section  ------------  """
 
     def monthly_results(self):
         """
-        Find the sums over a month by day.
+        Find the sums over a month by day.  The totals, status counts and
+        instruments for every day come from one grouped query.
 
         :return: (list) a list of rows/columns for the monthly table
         """
-        results = []
         yr, mo = self.monthly_date.split('-')
-        for day in date_iter(yr, mo):
-            tally = self.monthlyTOTAL(day)
-            insts = self.monthlyINST(day)
+        day_rows = {}
+        for row in self._monthly_counts(yr, mo):
+            day_rows.setdefault(str(row['utd']), []).append(row)
 
-            day_result = {'date': day, 'total_files': tally,
-                          'instruments': insts}
+        results = []
+        for day in date_iter(yr, mo):
+            day_result = {'date': day, 'total_files': 0, 'instruments': ''}
             for key in self.status_opts:
-                keyword = key.lower()
-                day_result[keyword] = self.monthlySTATUS(keyword, day)
+                day_result[key.lower()] = 0
+
+            inst_list = []
+            for row in day_rows.get(day, []):
+                num = row['num']
+                day_result['total_files'] += num
+
+                # match the LIKE '%status%' used by monthlySTATUS
+                status = (row['status'] or '').lower()
+                for key in self.status_opts:
+                    keyword = key.lower()
+                    if keyword in status:
+                        day_result[keyword] += num
 
+                if row['instrument'] and row['instrument'] not in inst_list:
+                    inst_list.append(row['instrument'])
+
+            day_result['instruments'] = ', '.join(inst_list)
             results += [day_result]
 
         return results
 
+    def _monthly_counts(self, yr, mo):
+        """
+        Count the lev0 files by day,  status and instrument over a month.
+        Days settled for longer than ROLLUP_LAG_DAYS are read from the
+        koa_status_daily rollup,  the recent days and the days missing from
+        the rollup from koa_status.
+
+        :param yr: (str) YYYY format
+        :param mo: (str) MM format
+
+        :return: (list) rows of utd, status, instrument, num
+        """
+        start, end = date_bounds(f'{yr}-{mo:0>2}')
+        cutoff = datetime.utcnow() - timedelta(days=ROLLUP_LAG_DAYS)
+        cutoff = min(max(cutoff.strftime('%Y-%m-%d'), start), end)
+
+        results = []
+        if start < cutoff:
+            rollup = self._rollup_counts(start, cutoff)
+            if rollup is None:
+                cutoff = start
+            else:
+                rows, missing = rollup
+                results += rows
+                if missing:
+                    last = datetime.strptime(missing[-1], '%Y-%m-%d')
+                    last = (last + timedelta(days=1)).strftime('%Y-%m-%d')
+                    results += [row for row in self._status_counts(missing[0], last)
+                                if str(row['utd']) in missing]
+
+        if cutoff < end:
+            results += self._status_counts(cutoff, end)
+
+        return results
+
+    def _status_counts(self, start, end):
+        """
+        Count the lev0 files by day,  status and instrument from koa_status.
+
+        :param start: (str) first day YYYY-MM-DD
+        :param end: (str) day after the last day YYYY-MM-DD
+
+        :return: (list) rows of utd, status, instrument, num
+        """
+        query = 'SELECT DATE(utdatetime) AS utd, status, instrument, '
+        query += 'COUNT(*) AS num FROM koa_status '
+        query += 'WHERE utdatetime >= %s AND utdatetime < %s AND level=0'
+        params = (start, end)
+
+        query, params = self._add_inst_query(query, params)
+        query += ' GROUP BY utd, status, instrument ORDER BY utd, instrument'
+
+        return list(self.db_functions.make_query(query, params))
+
+    def _rollup_counts(self, start, end):
+        """
+        Count the lev0 files by day,  status and instrument from the
+        koa_status_daily rollup.  A day without any counted rollup rows has
+        not been rolled up (or has no files),  it is returned as missing.
+
+        :param start: (str) first day YYYY-MM-DD
+        :param end: (str) day after the last day YYYY-MM-DD
+
+        :return: (list, list) rows of utd, status, instrument, num,  the
+                 missing days YYYY-MM-DD,  None if the rollup cannot be read
+        """
+        query = 'SELECT utdate AS utd, status, instrument, '
+        query += 'CAST(SUM(num_files) AS SIGNED) AS num FROM koa_status_daily '
+        query += 'WHERE utdate >= %s AND utdate < %s AND level=0 AND num_files > 0'
+        params = (start, end)
+
+        query, params = self._add_inst_query(query, params)
+        query += ' GROUP BY utd, status, instrument ORDER BY utd, instrument'
+
+        days_query = 'SELECT DISTINCT utdate FROM koa_status_daily '
+        days_query += 'WHERE utdate >= %s AND utdate < %s AND num_files > 0'
+
+        try:
+            rows = list(self.db_functions.make_query(query, params))
+            days = self.db_functions.make_query(days_query, (start, end))
+        except Exception:
+            return None
+
+        covered = {str(row['utdate']) for row in days}
+        missing = []
+        day = datetime.strptime(start, '%Y-%m-%d')
+        while day.strftime('%Y-%m-%d') < end:
+            if day.strftime('%Y-%m-%d') not in covered:
+                missing.append(day.strftime('%Y-%m-%d'))
+            day += timedelta(days=1)
+
+        return rows, missing
+
+    def _add_inst_query(self, query, params):
+        """
+        Limit the query to the inst or tel parameters.
+
+        :return: (str, tuple) query string and escaped parameters for query
+        """
+        if self.params.inst:
+            query += ' AND instrument LIKE %s'
+            params += ("%" + self.params.inst + "%",)
+
+        query += self._add_tel_query("AND")
+
+        return query, params
+
     def change_table_name(self, table_view):
         """
         Update the variable for the table view.
@@ -702,13 +1067,16 @@ class KoaRtiApi:
         """
         return [self.keck1_inst, self.keck2_inst]
 
-    def _get_time_diff(self, start_key, end_key, table='koa_status'):
+    def _get_time_diff(self, start_key, end_key, table='koa_status',
+                       sums_only=None):
         """
         Find the time difference
 
         :param start_key: <str> The database field for the starting time.
         :param end_key: <str> The database field for the ending time.
         :param table: <str> The database table name.
+        :param sums_only: <bool> only compute the sums,  on the database.
+                          Default is True for the data=0 parameter.
         :return: [{koaid, instrument, TIMEDIFF}]
         """
         sums = {}
@@ -716,10 +1084,18 @@ class KoaRtiApi:
 
         if not start_key or not end_key:
             return [], sums
+        if sums_only is None:
+            sums_only = self.params.data == 0
+
         tdiff_str = f"TIMEDIFF({end_key}, {start_key})"
         if 'lev0' in start_key or 'lev0' in end_key or 'lev2' in start_key or 'lev1' in start_key:
+            if sums_only:
+                return self._drp_results(tdiff_str, table, sums_only=True)
             results_dict = self._drp_results(tdiff_str, table)
         else:
+            if sums_only:
+                fields = f'TIME_TO_SEC({tdiff_str}) AS seconds, filesize_mb, archsize_mb'
+                return self._metrics_results(fields, table, sums_only=True)
             fields = f'koaid, instrument, level, filesize_mb, archsize_mb, {tdiff_str}'
             results_dict = self._metrics_results(fields, table)
 
@@ -727,7 +1103,11 @@ class KoaRtiApi:
             cln_results[level] = []
             sums[level] = {'total_time_seconds': 0,
                            'total_filesize': 0.0,
-                           'total_arch_size': 0.0}
+                           'total_arch_size': 0.0,
+                           'num_files': 0,
+                           'min_seconds': None,
+                           'max_seconds': None,
+                           'mean_seconds': None}
             results = results_dict[level]
             for result in results:
                 try:
@@ -742,59 +1122,128 @@ class KoaRtiApi:
                 del result[tdiff_str]
                 cln_results[level].append(result)
 
-        return cln_results, sums
+            if sums[level]['num_files']:
+                sums[level]['mean_seconds'] = (sums[level]['total_time_seconds']
+                                               / sums[level]['num_files'])
 
-    def _sec_to_mins(self, stats):
-        stat_min = {}
-        for ky, val in stats.items():
-            new_ky = int(ky / 60)
-            stat_min[new_ky] = val
+        return cln_results, sums
 
-        return stat_min
+    def _metrics_results(self, fields, table, sums_only=False):
+        """
+        The metrics rows by level,  or with sums_only the sums by level
+        computed on the database.
 
-    def _metrics_results(self, fields, table):
-        results = {}
+        :return: (dict) results by level,  with sums_only (results, sums)
+        """
+        queries = {}
         # level can be 0
         if not self.params.level:
-            query, params = self._generic_query(key=fields, table=table)
-            results['lev0'] = self.db_functions.make_query(query, params)
+            queries['lev0'] = self._generic_query(key=fields, table=table)
 
         if self.params.level in {None, 1}:
-            results['lev1'] = self.searchLEV1(columns=fields)
+            queries['lev1'] = self._lev1_select(columns=fields)
+
+        if sums_only:
+            return self._metrics_query_sums(queries)
+
+        results = {}
+        for level, (query, params) in queries.items():
+            if level == 'lev1':
+                results[level] = self._lev1_query(query, params)
+            else:
+                results[level] = self.db_functions.make_query(query, params)
 
         return results
 
-    def _drp_results(self, tdiff, table):
+    def _drp_results(self, tdiff, table, sums_only=False):
+        """
+        The DRP metrics rows,  lev0 joined to lev1 or lev2,  or with
+        sums_only the sums computed on the database.
+
+        :return: (dict) results by level,  with sums_only (results, sums)
+        """
         results = {'DRP': []}
 
         query = None
 
         if 'lev1' in tdiff:
-            query = f"SELECT lev0.koaid, lev0.instrument, lev1.level, " \
-                    f"lev0.filesize_mb, lev1.archsize_mb, {tdiff} " \
-                    f"FROM {table} lev1, {table} lev0 " \
-                    f"WHERE lev0.koaid=lev1.koaid AND lev0.level=0 AND lev1.level=1"
-            # if self.params.inst:
-            #     query += f" AND instrument={self.params.inst}"
-            query = self._add_koaid_daterange(query, 'lev1.koaid', " AND ")
+            lev = 'lev1'
         elif 'lev2' in tdiff:
-            query = f"SELECT lev0.koaid, lev0.instrument, lev2.level, " \
-                    f"lev0.filesize_mb, lev2.archsize_mb, {tdiff} " \
-                    f"FROM {table} lev2, {table} lev0 " \
-                    f"WHERE lev0.koaid=lev2.koaid AND lev0.level=0 AND lev2.level=2"
-
-            query = self._add_koaid_daterange(query, 'lev2.koaid', " AND ")
+            lev = 'lev2'
+        else:
+            lev = None
+
+        if lev:
+            if sums_only:
+                fields = f"TIME_TO_SEC({tdiff}) AS seconds, " \
+                         f"lev0.filesize_mb AS filesize_mb, " \
+                         f"{lev}.archsize_mb AS archsize_mb"
+            else:
+                fields = f"lev0.koaid, lev0.instrument, {lev}.level, " \
+                         f"lev0.filesize_mb, {lev}.archsize_mb, {tdiff}"
+            query = f"SELECT {fields} " \
+                    f"FROM {table} {lev}, {table} lev0 " \
+                    f"WHERE lev0.koaid={lev}.koaid AND lev0.level=0 " \
+                    f"AND {lev}.level={lev[-1]}"
+            query = self._add_koaid_daterange(query, f'{lev}.koaid', " AND ")
 
         if query and self.params.inst:
             query += f" AND lev0.instrument='{self.params.inst}'"
 
+        if sums_only:
+            return self._metrics_query_sums({'DRP': (query, ())})
+
         if query:
             results['DRP'] = self.db_functions.make_query(query, ())
 
         return results
 
+    def _metrics_query_sums(self, queries):
+        """
+        Sum the non-negative time differences of each metrics query on the
+        database,  only one row per level is returned.
+
+        :param queries: (dict) level: (query, params),  each query selecting
+                        seconds, filesize_mb and archsize_mb
+
+        :return: (dict, dict) empty results by level,  sums by level
+        """
+        results = {}
+        sums = {}
+        for level, (query, params) in queries.items():
+            sum_query = "SELECT COUNT(seconds) AS num_files, " \
+                        "SUM(seconds) AS total_time_seconds, " \
+                        "SUM(filesize_mb) AS total_filesize, " \
+                        "SUM(archsize_mb) AS total_arch_size, " \
+                        "MIN(seconds) AS min_seconds, " \
+                        "MAX(seconds) AS max_seconds, " \
+                        "AVG(seconds) AS mean_seconds " \
+                        "FROM (" + query + ") AS metrics WHERE seconds >= 0"
+            try:
+                rows = self.db_functions.make_query(sum_query, params) if query else []
+            except Exception as err:
+                raise ValueError(err)
+
+            row = rows[0] if rows else {}
+            sums[level] = {
+                'total_time_seconds': float(row.get('total_time_seconds') or 0),
+                'total_filesize': float(row.get('total_filesize') or 0),
+                'total_arch_size': float(row.get('total_arch_size') or 0),
+                'num_files': int(row.get('num_files') or 0)}
+            for key in ('min_seconds', 'max_seconds', 'mean_seconds'):
+                val = row.get(key)
+                sums[level][key] = float(val) if val is not None else None
+            results[level] = []
+
+        return results, sums
+
     def _metrics_sums(self, sums, result, seconds):
         sums['total_time_seconds'] += seconds
+        sums['num_files'] += 1
+        if sums['min_seconds'] is None or seconds < sums['min_seconds']:
+            sums['min_seconds'] = seconds
+        if sums['max_seconds'] is None or seconds > sums['max_seconds']:
+            sums['max_seconds'] = seconds
         filesize = result.get('filesize_mb', 0.0)
         if filesize:
             sums['total_filesize'] += filesize
@@ -804,31 +1253,21 @@ class KoaRtiApi:
 
         return sums
 
-    def _bin_time_length(self, start_key, end_key):
-        """
-        Tally the number for each time bin.  ie, {DEIMOS : {'0:00:02: 42, ...}}
-
-        :return: (dict/dict/sum)
+    def _bin_time_length(self, start_key, end_key, bin_width=1, units=None):
         """
-        stats = {}
-        results_dict, sums = self._get_time_diff(start_key, end_key)
-        for level in results_dict.keys():
-            results = results_dict[level]
+        Tally the number for each time bin.  ie, {DEIMOS_lev0 : {2: 42, ...}}
 
-            for result in results:
-                inst = f"{result['instrument']}_{level}"
-                tm = int(result['seconds'])
+        :param start_key: <str> The database field for the starting time.
+        :param end_key: <str> The database field for the ending time.
+        :param bin_width: <int> the bin width in units.
+        :param units: <str> the bin units,  s, mins or hrs.
 
-                if inst in stats:
-                    if tm in stats[inst]:
-                        stats[inst][tm] += 1
-                    else:
-                        stats[inst][tm] = 1
-                else:
-                    stats[inst] = {}
-                    stats[inst][tm] = 1
+        :return: (dict/dict) counts by bin start for each instrument_level
+        """
+        results_dict, sums = self._get_time_diff(start_key, end_key,
+                                                 sums_only=False)
 
-        return stats
+        return bin_time_length(results_dict, bin_width, units)
 
     def _generic_query(self, columns=None, key=None, val=None,
                        add=None, level=None, table=None):
@@ -852,20 +1291,23 @@ class KoaRtiApi:
         if level and level in (1, 2):
             date_val = 'process_start_time'
 
-        if self.params.chk and self.params.chk == 1:
-            if self.utd and self.params.utd2:
-                query += f" {add_str} {date_val} between %s and %s"
-                params += (self.utd, self.params.utd2 + ' 23:59:59')
-                add_str = " AND "
-            elif self.utd:
-                query += f" {add_str} {date_val} LIKE %s"
-                params += ("%" + self.utd + "%", )
-                add_str = " AND "
+        if self.params.chk and self.params.chk == 1 and self.utd:
+            date_query, date_params = date_predicate(date_val, self.utd,
+                                                     self.params.utd2)
+            query += f" {add_str} {date_query}"
+            params += date_params
+            add_str = " AND "
 
         if add:
             query += f" {add_str} {add} "
+            add_str = " AND "
 
-        query, params = self._add_general_query(query, params, add_str)
+        if self.cursor:
+            query += f" {add_str} (last_mod >= %s OR id > %s)"
+            params += self.cursor
+            add_str = " AND "
+
+        query, params = self._add_general_query(query, params, add_str, table)
 
         return query, params
 
@@ -877,9 +1319,9 @@ class KoaRtiApi:
 
         :return: (str, tuple) query string and escaped parameters for query
         """
-        query = f'SELECT COUNT(*) FROM koa_status WHERE utdatetime LIKE %s'
+        date_query, params = date_predicate('utdatetime', day)
+        query = f'SELECT COUNT(*) FROM koa_status WHERE {date_query}'
         query += f' AND level=0'
-        params = ("%" + day + "%",)
         if self.params.inst:
             query += f' AND instrument LIKE %s'
             params += ("%" + self.params.inst + "%",)
@@ -888,14 +1330,39 @@ class KoaRtiApi:
 
         return query, params
 
-    def _add_general_query(self, query, params, add_str):
+    def _add_general_query(self, query, params, add_str, table='koa_status'):
+        """
+        Add the inst and tel filters,  the order and the limit.  With a next
+        token (see next_token) the page starts after the (utdatetime, id) of
+        the last row of the previous page,  so pages stay stable while rows
+        are inserted and the database only reads the rows of the page.
+
+        :param table: (str) the table with the utdatetime and id columns
+        :return: (str, tuple) query string and escaped parameters for query
+        """
         if self.params.inst:
             query += f" {add_str} instrument LIKE %s"
             params += ("%" + self.params.inst + "%", )
             add_str = " AND "
 
-        query += self._add_tel_query(add_str)
-        query += " ORDER BY utdatetime DESC"
+        tel_query = self._add_tel_query(add_str)
+        if tel_query:
+            query += tel_query
+            add_str = " AND "
+
+        if self.params.next:
+            utd, row_id = self._page_after()
+            utd_col, id_col = f"{table}.utdatetime", f"{table}.id"
+            # rows without a utdatetime are sorted last
+            if utd is None:
+                query += f" {add_str} ({utd_col} IS NULL AND {id_col} < %s)"
+                params += (row_id, )
+            else:
+                query += f" {add_str} ({utd_col} < %s OR ({utd_col} = %s AND "
+                query += f"{id_col} < %s) OR {utd_col} IS NULL)"
+                params += (utd, utd, row_id)
+
+        query += f" ORDER BY utdatetime DESC, {table}.id DESC"
 
         if self.limit:
             query += " LIMIT %s"
@@ -903,6 +1370,61 @@ class KoaRtiApi:
 
         return query, params
 
+    def is_paged(self):
+        """
+        Determine if the search is pageable,  the searches built with
+        _add_general_query apply the limit and the next token.
+
+        :return: (bool) True if the search supports next
+        """
+        if not self.params.search:
+            return False
+
+        return self.params.search.upper().replace('_', '') in PAGED_SEARCHES
+
+    def next_token(self, results):
+        """
+        The opaque token of the page after the results,  passed back as
+        next=token with the same query parameters.
+
+        :param results: (list) the rows of a limited search
+        :return: (str) None for the last page,  without a limit or for a
+                 search that is not paged
+        """
+        if not self.limit or not self.is_paged():
+            return None
+        if not isinstance(results, (list, tuple)):
+            return None
+        if len(results) < self.limit:
+            return None
+
+        last = results[-1]
+        if 'id' not in last or 'utdatetime' not in last:
+            return None
+
+        utd = last['utdatetime']
+        if isinstance(utd, datetime):
+            utd = utd.strftime('%Y-%m-%d %H:%M:%S')
+        token = json.dumps([utd, int(last['id'])]).encode('utf-8')
+
+        return base64.urlsafe_b64encode(token).decode('ascii').rstrip('=')
+
+    def _page_after(self):
+        """
+        :return: (str, int) the utdatetime and id in the next token
+        """
+        token = str(self.params.next)
+        try:
+            token += '=' * (-len(token) % 4)
+            utd, row_id = json.loads(base64.urlsafe_b64decode(token))
+            if utd is not None:
+                datetime.strptime(utd, '%Y-%m-%d %H:%M:%S')
+            row_id = int(row_id)
+        except (ValueError, TypeError):
+            raise ValueError(f"invalid next token: {self.params.next}")
+
+        return utd, row_id
+
     def _add_tel_query(self, add_str):
         """
         Include the telescope number as part of the DB query.
@@ -926,33 +1448,204 @@ class KoaRtiApi:
         :param koaid: (str) the koaid to quewry the header.
         :return:
         """
-        query = f"SELECT HEADER FROM headers WHERE KOAID='{koaid}';"
+        return read_headers([koaid], self.db_functions).get(koaid, {})
 
-        header = self.db_functions.make_query(query, None)
-        if header and type(header) == list:
-            header = (dict(header[0])['HEADER'])
-            header = json.loads(header)
-        else:
-            header = {}
+    def read_headers(self, koaids):
+        """
+        Get the headers for a list of KOAIDs.
+
+        :param koaids: (list) the koaids to query the header.
+        :return: (dict) header dict by koaid,  {} for a missing header
+        """
+        return read_headers(koaids, self.db_functions)
+
+    def query_key(self):
+        """
+        The normalized query parameters,  instances with the same key return
+        the same results.
+
+        :return: (tuple) the set parameters and the cursor
+        """
+        key = tuple(sorted((name, val) for name, val
+                           in self.params._asdict().items() if val is not None))
+        if self.cursor:
+            key += (('cursor', self.cursor),)
+
+        return key
+
+    def with_cursor(self, cursor):
+        """
+        A copy of the instance that only returns the rows inserted or
+        modified since the cursor,  used for the daily table delta updates.
+
+        :param cursor: (str) 'YYYY-MM-DD HH:MM:SS|id',  see table_cursor
+        :return: (KoaRtiApi) the copy
+        """
+        last_mod, row_id = cursor.split('|')
+        datetime.strptime(last_mod, '%Y-%m-%d %H:%M:%S')
+
+        api = copy.copy(self)
+        api.cursor = (last_mod, int(row_id))
+
+        return api
+
+    def delta_safe(self):
+        """
+        Determine if the daily table can be updated with the changed rows
+        only (see with_cursor).  A modified row can leave a status or other
+        search filter,  or the process_start_time range of levels 1 and 2,
+        and a limited table drops its oldest rows,  the delta would not
+        remove them so those tables are sent in full.
+
+        :return: (bool) True if rows can only enter the filter
+        """
+        if self.params.search and self.params.search.upper() != 'DATE':
+            return False
+        if self.limit:
+            return False
+        if self.params.chk == 1 and self.utd and self._watch_level() in (1, 2):
+            return False
+
+        return True
+
+    def watch_key(self):
+        """
+        The filter of the daily table rows,  pages with the same key share
+        one change check.
+
+        :return: (tuple) the filter,  None when the page is not updated
+        """
+        if not self.is_daily():
+            return None
+
+        level = self._watch_level()
+        utd = self.utd if self.params.chk == 1 else None
+
+        return ('koa_status', level, utd, self.params.utd2, self.params.tel,
+                self.params.inst)
 
-        return header
+    def _watch_level(self):
+        """
+        :return: (int) the level of the query,  None for all levels
+                 (like _generic_query,  no level or 0 is not filtered)
+        """
+        if not self.params.level:
+            return None
+
+        return int(self.params.level)
 
-    def has_changed(self, request_time):
+    def has_watermark(self):
         """
-        Returns True if resource is updated or it's the first time it has
-        been requested.
+        Determine if the watermark changes with the results of the query,
+        only the koa_status searches of _generic_query.  The header,  lev1
+        (by KOAID date),  rollup,  TPX and metrics queries read other tables
+        or date columns.
 
-        :param request_time: (time.time) current time.
+        :return: (bool) True if the query results are in the watermark filter
+        """
+        if not self.params.search:
+            return False
+
+        return self.params.search.upper().replace('_', '') in WATERMARK_SEARCHES
+
+    def watermark(self):
+        """
+        High-water mark of the rows in the watch_key filter,  it changes when
+        a row is inserted or modified (or deleted within a date range).  The
+        date range is on the same column as _generic_query,  utdatetime or
+        process_start_time for levels 1 and 2,  the row count is skipped
+        without a date range to avoid scanning the level.
 
-        :return: (bool) True if modified after request_time.
+        :return: (tuple) max last_mod,  max id,  number of rows
         """
-        filepath = "/var/lib/mysql/koa/koa_status.ibd"
+        level = self._watch_level()
+        in_range = self.params.chk == 1 and self.utd
 
+        query = "SELECT MAX(last_mod) AS last_mod, MAX(id) AS id"
+        query += ", COUNT(*) AS num" if in_range else ", NULL AS num"
+        if level is None:
+            # all levels,  kept as an index range on the level
+            query += " FROM koa_status WHERE level IN (0, 1, 2)"
+            params = ()
+        else:
+            query += " FROM koa_status WHERE level=%s"
+            params = (level,)
+        if in_range:
+            date_val = 'process_start_time' if level in (1, 2) else 'utdatetime'
+            date_query, date_params = date_predicate(date_val, self.utd,
+                                                     self.params.utd2)
+            query += f" AND {date_query}"
+            params += date_params
+
+        query, params = self._add_inst_query(query, params)
+        row = self.db_functions.make_query(query, params)[0]
+
+        return row['last_mod'], row['id'], row['num']
+
+def read_headers(koaids, db_functions=None):
+    """
+    Get the parsed headers for a list of KOAIDs.  Headers are served from
+    HEADER_CACHE,  the misses are fetched in one query.
+
+    :param koaids: (list) the koaids to query the header.
+    :param db_functions: (DatabaseInteraction) optional,  default is a new one.
+
+    :return: (dict) header dict by koaid,  {} for a missing header
+    """
+    headers = {}
+    missing = []
+    for koaid in koaids:
+        header = HEADER_CACHE.get(koaid)
+        if header is None:
+            missing.append(koaid)
+        else:
+            headers[koaid] = header
+
+    if not missing:
+        return headers
+
+    if not db_functions:
+        db_functions = DatabaseInteraction()
+
+    query = "SELECT KOAID, HEADER FROM headers WHERE KOAID IN "
+    query += f"({', '.join(['%s'] * len(missing))})"
+    rows = db_functions.make_query(query, tuple(missing))
+
+    requested = {koaid.upper(): koaid for koaid in missing}
+    for row in rows or []:
+        row = dict(row)
+        koaid = requested.get(row['KOAID'].upper(), row['KOAID'])
+        raw = row['HEADER']
         try:
-            if self.is_daily() and stat(filepath).st_mtime > request_time:
-                return True
-        except:
-            pass
+            header = json.loads(raw)
+        except (TypeError, ValueError):
+            continue
+
+        headers[koaid] = header
+        HEADER_CACHE.set(koaid, header, len(raw))
+
+    for koaid in missing:
+        if koaid not in headers:
+            headers[koaid] = {}
+            HEADER_CACHE.set(koaid, {}, len(koaid), ttl=HEADER_MISSING_TTL)
+
+    return headers
+
+
+def plot_executor():
+    """
+    The thread pool shared by all requests for computing plots.
+
+    :return: (ThreadPoolExecutor) with PLOT_WORKERS threads
+    """
+    global PLOT_EXECUTOR
+    with PLOT_EXECUTOR_LOCK:
+        if not PLOT_EXECUTOR:
+            PLOT_EXECUTOR = ThreadPoolExecutor(max_workers=PLOT_WORKERS,
+                                               thread_name_prefix='rti_plots')
+
+    return PLOT_EXECUTOR
 
-        return False
 
+# one detector checks the daily table filters for all the updating clients
+STATUS_WATCH = ChangeWatcher('koa_status_watch')
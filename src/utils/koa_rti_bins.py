@@ -0,0 +1,115 @@
+import numpy as np
+
+# seconds per unit of the binned times
+UNIT_SECONDS = {None: 1, 's': 1, 'mins': 60, 'hrs': 3600}
+
+
+def time_columns(results_dict):
+    """
+    Array backed columns of the metrics rows.
+
+    :param results_dict: (dict) {level: [{instrument, seconds, ...}]} from
+                         KoaRtiApi._get_time_diff
+
+    :return: (list, ndarray, ndarray) series names (INST_level),
+             series index of each row,  seconds of each row
+    """
+    names = []
+    codes = []
+    seconds = []
+    for level, results in results_dict.items():
+        if not results:
+            continue
+
+        insts = np.array([result['instrument'] for result in results])
+        secs = np.fromiter((result['seconds'] for result in results),
+                           dtype=np.float64, count=len(results))
+        level_names, level_codes = np.unique(insts, return_inverse=True)
+
+        codes.append(level_codes + len(names))
+        seconds.append(secs)
+        names += [f"{inst}_{level}" for inst in level_names]
+
+    if not names:
+        return names, np.empty(0, dtype=np.intp), np.empty(0)
+
+    return names, np.concatenate(codes), np.concatenate(seconds)
+
+
+def bin_columns(names, codes, seconds, bin_width=1, units=None):
+    """
+    Count the rows of each series in time bins.  Only occupied bins are
+    returned,  so outliers do not create dense arrays.
+
+    :param names: (list) series names
+    :param codes: (ndarray) series index of each row
+    :param seconds: (ndarray) seconds of each row
+    :param bin_width: (int) bin width in units
+    :param units: (str) units of the bins,  s, mins or hrs
+
+    :return: (dict) {name: {bin start (units): count}}
+    """
+    stats = {}
+    if not names:
+        return stats
+
+    bins = np.floor(seconds / (UNIT_SECONDS[units] * bin_width)).astype(np.int64)
+    nbins = int(bins.max()) + 1 if len(bins) else 1
+
+    keys, counts = np.unique(codes.astype(np.int64) * nbins + bins,
+                             return_counts=True)
+    key_codes, key_bins = np.divmod(keys, nbins)
+    for code, tm, num in zip(key_codes.tolist(), (key_bins * bin_width).tolist(),
+                             counts.tolist()):
+        stats.setdefault(names[code], {})[tm] = num
+
+    return stats
+
+
+def bin_time_length(results_dict, bin_width=1, units=None):
+    """
+    Tally the number of files in each time bin by instrument and level,
+    ie {DEIMOS_lev0: {2: 42, ...}}.
+
+    :param results_dict: (dict) {level: [{instrument, seconds, ...}]}
+    :param bin_width: (int) bin width in units
+    :param units: (str) units of the bins,  s, mins or hrs
+
+    :return: (dict) {name: {bin start (units): count}}
+    """
+    names, codes, seconds = time_columns(results_dict)
+
+    return bin_columns(names, codes, seconds, bin_width, units)
+
+
+def histogram_summary(results_dict, bin_width=1, units=None,
+                      percentiles=(50, 90, 95, 99)):
+    """
+    Compact histograms of the metrics times for each instrument and level,
+    only the occupied bins are listed.
+
+    :param results_dict: (dict) {level: [{instrument, seconds, ...}]}
+    :param bin_width: (int) bin width in units
+    :param units: (str) units of the bins and percentiles,  s, mins or hrs
+    :param percentiles: (tuple) the percentiles to return
+
+    :return: (dict) {name: {'bins': [bin start], 'counts': [count],
+                            'num_files': int, 'percentiles': {'p50': ...}}}
+    """
+    names, codes, seconds = time_columns(results_dict)
+    stats = bin_columns(names, codes, seconds, bin_width, units)
+    times = seconds / UNIT_SECONDS[units]
+
+    summary = {}
+    for code, name in enumerate(names):
+        bins = sorted(stats.get(name, {}))
+        series = times[codes == code]
+        pct = np.percentile(series, percentiles) if len(series) else []
+        summary[name] = {
+            'bins': bins,
+            'counts': [stats[name][tm] for tm in bins],
+            'num_files': int(len(series)),
+            'percentiles': {f'p{p}': round(float(val), 3)
+                            for p, val in zip(percentiles, pct)}}
+
+    return summary
@@ -0,0 +1,145 @@
+import time
+import threading
+from collections import OrderedDict
+
+# all named caches,  used to report the stats for monitoring
+CACHES = {}
+
+# bumped on ingest activity,  caches of current data include it in their keys
+ACTIVITY = {'version': 0}
+ACTIVITY_LOCK = threading.Lock()
+
+
+class LruCache:
+
+    def __init__(self, name, max_bytes, max_entries=None, ttl=None):
+        """
+        Thread safe least recently used cache bounded by the total size of
+        the entries (bytes) and optionally the number of entries.
+
+        :param name: (str) name used in the cache stats
+        :param max_bytes: (int) max total size of the entries
+        :param max_entries: (int) optional max number of entries
+        :param ttl: (float) default seconds before an entry expires,
+                            None to never expire
+        """
+        self.name = name
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.lock = threading.Lock()
+        self.counts = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0}
+
+        CACHES[name] = self
+
+    def get(self, key, default=None):
+        """
+        Return the cached value for key.
+
+        :param key: the cache key
+        :param default: returned when key is missing or expired
+
+        :return: the cached value or default
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.counts['misses'] += 1
+                return default
+
+            value, nbytes, expires = entry
+            if expires and expires < time.monotonic():
+                self._remove(key)
+                self.counts['expired'] += 1
+                self.counts['misses'] += 1
+                return default
+
+            self.entries.move_to_end(key)
+            self.counts['hits'] += 1
+
+            return value
+
+    def set(self, key, value, nbytes, ttl=None):
+        """
+        Add or replace a value,  evicting the least recently used entries
+        to stay within the bounds.  Values larger than max_bytes are not cached.
+
+        :param key: the cache key
+        :param value: the value to cache
+        :param nbytes: (int) the size of the value
+        :param ttl: (float) seconds before the entry expires,
+                            default is the cache ttl
+        """
+        if nbytes > self.max_bytes:
+            return
+
+        if ttl is None:
+            ttl = self.ttl
+        expires = time.monotonic() + ttl if ttl else None
+
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+
+            self.entries[key] = (value, nbytes, expires)
+            self.nbytes += nbytes
+
+            while (self.nbytes > self.max_bytes or self.max_entries
+                   and len(self.entries) > self.max_entries):
+                self._remove(next(iter(self.entries)))
+                self.counts['evictions'] += 1
+
+    def pop(self, key):
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        """
+        :return: (dict) the counters,  size and hit rate of the cache
+        """
+        with self.lock:
+            stats = dict(self.counts)
+            stats['entries'] = len(self.entries)
+            stats['bytes'] = self.nbytes
+            stats['max_bytes'] = self.max_bytes
+
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else None
+
+        return stats
+
+    def _remove(self, key):
+        value, nbytes, expires = self.entries.pop(key)
+        self.nbytes -= nbytes
+
+
+def cache_stats():
+    """
+    :return: (dict) the stats of every named cache
+    """
+    return {name: cache.stats() for name, cache in CACHES.items()}
+
+
+def note_activity():
+    """
+    Record new ingest activity,  cache entries keyed on the previous
+    activity_version() are no longer used.
+    """
+    with ACTIVITY_LOCK:
+        ACTIVITY['version'] += 1
+
+
+def activity_version():
+    """
+    :return: (int) the number of times note_activity has been called
+    """
+    return ACTIVITY['version']
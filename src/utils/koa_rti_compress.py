@@ -0,0 +1,54 @@
+import gzip
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# smaller responses are sent uncompressed
+COMPRESS_MIN_BYTES = 1024
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def accepted_encoding(accept_encoding):
+    """
+    Choose the response compression from the Accept-Encoding header,
+    brotli (when installed) is preferred over gzip.
+
+    :param accept_encoding: (str) ie 'gzip, deflate, br;q=0.9'
+    :return: (str) 'br',  'gzip' or None for no compression
+    """
+    accepted = {}
+    for coding in (accept_encoding or '').lower().split(','):
+        name, _, params = coding.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+
+    offered = ['br', 'gzip'] if brotli else ['gzip']
+    quality = {name: accepted.get(name, accepted.get('*', 0.0))
+               for name in offered}
+    best = max(offered, key=lambda name: quality[name])
+
+    return best if quality[best] > 0 else None
+
+
+def compress(body, encoding):
+    """
+    :param body: (bytes) the response body
+    :param encoding: (str) 'br' or 'gzip' from accepted_encoding
+    :return: (bytes) the compressed body
+    """
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+    raise ValueError(f"unsupported encoding: {encoding}")
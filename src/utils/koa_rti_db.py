@@ -2,6 +2,7 @@ import sys
 from os import path
 import pymysql
 import db_conn
+from flask import g, has_request_context
 
 sys.path.append(path.dirname(path.dirname(path.abspath(__file__))))
 from db_conn import db_conn
@@ -10,6 +11,78 @@ CONFIG_FILE = "../config.live.ini"
 APP_PATH = path.abspath(path.dirname(__file__))
 
 
+class DatabaseSession:
+    def __init__(self, conn_obj):
+        """
+        Request scoped database session.  A connection for each database is
+        borrowed from the pool on first use and reused by every query in the
+        request until close().
+
+        :param conn_obj: (db_conn) the connection layer to borrow from.
+        """
+        self.conn_obj = conn_obj
+        self.conns = {}
+        self.num_queries = 0
+
+    def connect(self, db_name):
+        conn = self.conns.get(db_name)
+        if not conn:
+            conn = self.conn_obj.connect(db_name)
+            if conn:
+                self.conns[db_name] = conn
+
+        return conn
+
+    def release(self, db_name, conn, broken=False):
+        """
+        Only broken connections are given back before the request ends.
+        """
+        if broken and self.conns.get(db_name) is conn:
+            del self.conns[db_name]
+            self.conn_obj.release(db_name, conn, broken=True)
+
+    def close(self):
+        """
+        Return all connections to the pool.
+
+        :return: (int) the number of statements run in the session
+        """
+        for db_name, conn in self.conns.items():
+            self.conn_obj.release(db_name, conn)
+        self.conns = {}
+
+        return self.num_queries
+
+
+def get_session(conn_obj=None):
+    """
+    Return the session for the current flask request,  opening it if needed.
+
+    :param conn_obj: (db_conn) used to open the session.
+    :return: (DatabaseSession) None when outside of a request.
+    """
+    if not has_request_context():
+        return None
+
+    if 'db_session' not in g and conn_obj:
+        g.db_session = DatabaseSession(conn_obj)
+
+    return g.get('db_session', None)
+
+
+def close_session():
+    """
+    Release the session for the current request,  used by the app teardown.
+
+    :return: (int) the number of statements run,  None if no session was used
+    """
+    session = g.pop('db_session', None)
+    if not session:
+        return None
+
+    return session.close()
+
+
 class DatabaseInteraction:
     def __init__(self):
         # config file for db,  ie config.live.ini
@@ -19,49 +92,73 @@ class DatabaseInteraction:
         self.db_name = "koa"
         self.db = None
 
+    def _connector(self):
+        """
+        Use the request session when in a request,  otherwise the pool directly.
+        """
+        session = get_session(self.conn_obj)
+        if session:
+            return session
+
+        return self.conn_obj
+
     def connect_db(self, db_name, second_try=False):
-        conn = self.conn_obj.connect(db_name)
+        conn = self._connector().connect(db_name)
         if not conn:
             print(f"CANNOT Connect to DataBase: {db_name}")
-        try:
-            curse = conn.cursor(pymysql.cursors.DictCursor)
-        except:
             if second_try:
                 sys.exit(f"could not connect to the database: {db_name}")
-            self.connect_db(db_name, second_try=True)
+            return self.connect_db(db_name, second_try=True)
 
-        return curse
+        return conn
 
-    def close_db_connection(self, db_name):
-        self.conn_obj.close(db_name)
+    def close_db_connection(self, db_name, conn=None, broken=False):
+        if conn:
+            self._connector().release(db_name, conn, broken=broken)
+        else:
+            self.conn_obj.close(db_name)
 
     def get_db_connection(self):
         return self.db
 
     def make_query(self, query, params, db_name=None):
         """
-        Query the DB.  Opening/Closing connection avoids issues with the cursor
-        crashing.
+        Query the DB.  Within a flask request the request session connection
+        is reused,  otherwise a pooled connection is borrowed for the query and
+        returned afterwards.  The cursor is new for each query to avoid issues
+        with the cursor crashing.
 
         :param query:
         :param params: (tuple) the escaped parameters for the query string
         :return:
         """
-        if db_name:
-            self.db = self.connect_db(db_name)
-        else:
-            self.db = self.connect_db(self.db_name)
+        if not db_name:
+            db_name = self.db_name
 
-        if params:
-            self.db.execute(query, params)
-        else:
-            self.db.execute(query)
+        conn = self.connect_db(db_name)
+        session = get_session()
+        if session:
+            session.num_queries += 1
 
-        if 'UPDATE' in query.upper():
-            result = self.db.rowcount
-        else:
-            result = self.db.fetchall()
+        broken = False
+        try:
+            # local cursor,  the instance may be shared by plot threads
+            cursor = conn.cursor(pymysql.cursors.DictCursor)
+            self.db = cursor
+            if params:
+                cursor.execute(query, params)
+            else:
+                cursor.execute(query)
 
-        self.close_db_connection(self.db_name)
+            if 'UPDATE' in query.upper():
+                result = cursor.rowcount
+            else:
+                result = cursor.fetchall()
+            cursor.close()
+        except pymysql.err.OperationalError:
+            broken = True
+            raise
+        finally:
+            self.close_db_connection(db_name, conn, broken)
 
         return result
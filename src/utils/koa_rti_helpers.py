@@ -1,5 +1,6 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 from calendar import monthrange
+import re
 import sys
 import json
 import calendar
@@ -14,6 +15,14 @@ import testall
 APP_PATH = path.abspath(path.dirname(__file__))
 TESTALL_PATH = '/kroot/rel/default/data'
 
+# koa_status datetime columns,  searched with range predicates
+DATE_COLUMNS = {'utdatetime', 'creation_time', 'dep_start_time',
+                'dep_end_time', 'process_start_time', 'process_end_time',
+                'xfr_start_time', 'xfr_end_time', 'ipac_notify_time',
+                'ipac_response_time', 'ingest_start_time', 'ingest_end_time',
+                'ingest_copy_start_time', 'ingest_copy_end_time',
+                'stage_time', 'last_mod'}
+
 
 def year_range():
     """
@@ -162,9 +171,15 @@ def get_api_help_string(api_instance):
     help_str += "<li>progid=KNYYYY[A/B]_###,  Program ID (PYKOA only)"
     help_str += "<li>level=#,  the data processing level (0,1,2)"
     help_str += "<li>limit=###,  the number of results to limit the search"
+    help_str += "<li>next=token,  the next page of a limited search,  from "
+    help_str += "the 'next' of the previous page"
     help_str += "<li>data=[0 or 1], toggle the return of data array.  default=1"
+    help_str += ",  metrics with data=0 only return the sums"
     help_str += "<li>add=string to add to end of query"
     help_str += "<li>plot=#,  the bokeh plot to return [1-5]"
+    help_str += "<li>histogram=1,  metrics binned by instrument,  no file rows"
+    help_str += "<li>bin=#,  histogram bin width,  default=1"
+    help_str += "<li>units=[s, mins, hrs],  histogram units,  default=s"
     help_str += "<li>columns=column1,column2,...,  columns to return"
     help_str += "<BR><BR>Example: <BR><UL>"
     help_str += "<li>/koarti_api?search=GENERAL&val=TRANSFERRED&"
@@ -172,6 +187,7 @@ def get_api_help_string(api_instance):
     help_str += "&key=status&add=AND OFNAME_DELETED=0&utd=2020-12-20"
     help_str += "&utd2=2020-12-21<BR>"
     help_str += "<li>/koarti_api?search=STATUS&val=Transferred&utd=2020-11-21"
+    help_str += "<li>/koarti_api?search=HEADER&val=EXPTIME>300,TARGNAME"
     help_str += "<li>/koarti_api?update=GENERAL&columns=ofname_deleted"
     help_str += "&update_val=True&key=koaid&val=HI.20201104.1120.04"
 
@@ -216,22 +232,95 @@ def parse_filename_dir(result):
         return split_path[0], ''
 
 
-# def query_prefix(columns=None, key=None, val=None, table='koa_status'):
+def date_bounds(date_str, end_str=None):
+    """
+    The half-open [start, end) range covered by a date.  A day, month or year
+    covers the whole day, month or year,  with end_str the range runs through
+    the end of end_str.
+
+    :param date_str: (str) YYYY-MM-DD, YYYY-MM or YYYY
+    :param end_str: (str) optional last date of the range
+
+    :return: (str, str) YYYY-MM-DD start and end,  None if not a date
+    """
+    bounds = _date_span(date_str)
+    if not bounds:
+        return None
+
+    if end_str:
+        end_bounds = _date_span(end_str)
+        if not end_bounds:
+            return None
+        bounds = (bounds[0], end_bounds[1])
+
+    return tuple(dt.strftime('%Y-%m-%d') for dt in bounds)
+
+
+def _date_span(date_str):
+    """
+    :param date_str: (str) YYYY-MM-DD, YYYY-MM or YYYY
+
+    :return: (datetime, datetime) first day and the first day after the span
+    """
+    date_str = str(date_str).strip()
+    for fmt in ('%Y-%m-%d', '%Y-%m', '%Y'):
+        try:
+            start = datetime.strptime(date_str, fmt)
+        except ValueError:
+            continue
+
+        if fmt == '%Y-%m-%d':
+            end = start + timedelta(days=1)
+        elif fmt == '%Y-%m':
+            end = (start + timedelta(days=32)).replace(day=1)
+        else:
+            end = start.replace(year=start.year + 1)
+
+        return start, end
+
+    return None
+
+
+def date_predicate(column, date_str, end_str=None):
+    """
+    An index friendly predicate for a date or date range,  falls back to
+    LIKE when the date cannot be parsed.
+
+    :param column: (str) the datetime column
+    :param date_str: (str) YYYY-MM-DD, YYYY-MM or YYYY
+    :param end_str: (str) optional last date of the range
+
+    :return: (str, tuple) query string and escaped parameters for query
+    """
+    bounds = date_bounds(date_str, end_str)
+    if bounds:
+        return f"{column} >= %s AND {column} < %s", bounds
+
+    return f"{column} LIKE %s", ("%" + str(date_str) + "%",)
+
+
+def _key_predicate(key, val):
+    if key.lower() in DATE_COLUMNS:
+        return date_predicate(key, val)
+
+    return f"{key} LIKE %s", ("%" + val + "%",)
+
+
 def query_prefix(columns=None, key=None, val=None, table=None, level=None):
     if not table:
         table = 'koa_status'
 
     if columns and key and val:
-        query = f"SELECT {columns} FROM {table} WHERE {key} LIKE %s"
-        params = ("%" + val + "%",)
+        where, params = _key_predicate(key, val)
+        query = f"SELECT {columns} FROM {table} WHERE {where}"
         add_str = " AND "
     elif columns:
         query = f"SELECT {columns} FROM {table}"
         params = ()
         add_str = " WHERE "
     elif key and val:
-        query = f"SELECT * FROM {table} WHERE {key} LIKE %s"
-        params = ("%" + val + "%",)
+        where, params = _key_predicate(key, val)
+        query = f"SELECT * FROM {table} WHERE {where}"
         add_str = " AND "
     elif key:
         query = f"SELECT {key} FROM {table}"
@@ -249,6 +338,67 @@ def query_prefix(columns=None, key=None, val=None, table=None, level=None):
     return query, params, add_str
 
 
+HEADER_TERM = re.compile(r'^\s*([A-Za-z0-9_\-]{1,72})\s*(?:(>=|<=|!=|=|>|<)\s*(.*?))?\s*$')
+
+
+def parse_header_terms(val):
+    """
+    Parse a header search value into keywords and optional comparisons,
+    ie "EXPTIME>300,TARGNAME=HD 1234,AIRMASS".
+
+    :param val: (str) comma separated keyword[op value] terms
+
+    :return: (list) (keyword, operator or None, value or None) tuples
+    """
+    terms = []
+    for term in str(val).split(','):
+        if not term.strip():
+            continue
+        match = HEADER_TERM.match(term)
+        if not match:
+            raise ValueError(f"invalid header term: {term}")
+        keyword, operator, value = match.groups()
+        terms.append((keyword.upper(), operator, value))
+
+    if not terms:
+        raise ValueError("no header keywords,  use val=KEYWORD[op value],...")
+
+    return terms
+
+
+def header_term_query(terms):
+    """
+    Column and predicate SQL extracting and filtering header keywords on the
+    database with JSON path functions.
+
+    :param terms: (list) from parse_header_terms
+
+    :return: (str, tuple, str, tuple) select columns, their parameters,
+             where predicates, their parameters
+    """
+    columns = []
+    col_params = ()
+    where = []
+    where_params = ()
+    for keyword, operator, value in terms:
+        path = f'$."{keyword}".value'
+        extract = "JSON_UNQUOTE(JSON_EXTRACT(headers.header, %s))"
+        columns.append(f"{extract} AS `{keyword.lower()}`")
+        col_params += (path, )
+
+        if not operator:
+            continue
+
+        try:
+            value = float(value)
+            where.append(f"CAST({extract} AS DECIMAL(30,10)) {operator} %s")
+        except ValueError:
+            where.append(f"{extract} {operator} %s")
+        where_params += (path, value)
+
+    return ', '.join(columns), col_params, ' AND '.join(where), where_params
+
+
 def date_iter(year, month):
     """
     iterate over the days in a month.
@@ -289,14 +439,42 @@ def api_results(API_INSTANCE):
             return return_results(success=0, msg="use: progid=####")
 
     sums = None
+    if cmd_type == 'metrics' and params.histogram:
+        try:
+            histogram, sums = API_INSTANCE.get_histogram(cmd)
+        except ValueError as err:
+            return return_results(success=0, msg=str(err))
+
+        response = return_results(cmd=cmd, cmd_type=cmd_type, api=API_INSTANCE)
+        response['num_files'] = {name: hist['num_files']
+                                 for name, hist in histogram.items()}
+        response['histogram'] = histogram
+        response['sums'] = sums
+
+        return response
+
+    if cmd_type == 'search' and params.next and not API_INSTANCE.is_paged():
+        return return_results(
+            success=0, msg=f"next is not supported by search={params.search}")
+
     if cmd:
-        results, sums = get_cmd_results(API_INSTANCE, cmd, cmd_type, sums)
+        try:
+            results, sums = get_cmd_results(API_INSTANCE, cmd, cmd_type, sums)
+        except (AttributeError, ValueError) as err:
+            return return_results(success=0, msg=str(err))
 
     response = return_results(results=results, cmd=cmd, cmd_type=cmd_type,
                               api=API_INSTANCE)
 
+    if cmd_type == 'search' and API_INSTANCE.limit:
+        response['next'] = API_INSTANCE.next_token(results)
+
     if cmd_type == 'metrics':
         response['sums'] = sums
+        # with data=0 the rows are not returned,  only the sums are computed
+        if params.data == 0 and isinstance(sums, dict):
+            response['num_files'] = {level: lev_sums['num_files']
+                                     for level, lev_sums in sums.items()}
 
     return response
 
@@ -311,16 +489,14 @@ def get_cmd_results(API_INSTANCE, cmd, cmd_type, sums):
     :param sums: <object> the sum object that is calculated.
 
     :return: The database results,  the sum dictionary
-    """
-    try:
-        if cmd_type == 'metrics':
-            results, sums = getattr(API_INSTANCE, cmd_type + cmd)()
-        else:
-            results = getattr(API_INSTANCE, cmd_type + cmd)()
-    except (AttributeError, ValueError) as err:
-        return return_results(success=0, msg=str(err))
 
-    results = replace_datetime(results)
+    :raises: AttributeError for an unknown command,  ValueError for invalid
+             command parameters
+    """
+    if cmd_type == 'metrics':
+        results, sums = getattr(API_INSTANCE, cmd_type + cmd)()
+    else:
+        results = getattr(API_INSTANCE, cmd_type + cmd)()
 
     return results, sums
 
@@ -348,11 +524,37 @@ def get_results(API_INSTANCE):
         results = []
 
     db_columns = API_INSTANCE.getDbColumns()
-    results = replace_datetime(results)
 
     return results, db_columns
 
 
+def table_cursor(results, cursor=None):
+    """
+    The cursor of the newest rows,  the max last_mod and id.  Rows with a
+    last_mod at or after the cursor's are returned by the next delta update.
+
+    :param results: (list) the table rows
+    :param cursor: (str) the previous cursor,  kept if there are no rows
+
+    :return: (str) 'YYYY-MM-DD HH:MM:SS|id',  None without rows or cursor
+    """
+    last_mod, row_id = cursor.split('|') if cursor else ('', '0')
+    row_id = int(row_id)
+    for result in results or []:
+        row_mod = result.get('last_mod')
+        if isinstance(row_mod, datetime):
+            row_mod = row_mod.strftime("%Y-%m-%d %H:%M:%S")
+        if row_mod and str(row_mod) > last_mod:
+            last_mod = str(row_mod)
+        if result.get('id') and int(result['id']) > row_id:
+            row_id = int(result['id'])
+
+    if not last_mod:
+        return None
+
+    return f"{last_mod}|{row_id}"
+
+
 def update_search_page(API_INSTANCE, params):
     """
     Used to update the daily page or search results.
@@ -443,7 +645,8 @@ def parse_request(default_utd=True, method='GET'):
     args = ['utd', 'utd2', 'search', 'update', 'metrics', 'pykoa', 'val',
             'view', 'tel', 'inst', 'page', 'yr', 'month', 'limit', 'chk',
             'chk1', 'obsid', 'progid', 'plot', 'columns', 'key', 'add',
-            'level', 'data', 'update_val']
+            'level', 'data', 'update_val', 'histogram', 'bin', 'units',
+            'next']
 
     if method == 'GET':
         vars = dict((name, request.args.get(name)) for name in args)
@@ -503,6 +706,8 @@ def parse_args():
     parser.add_argument("--mode", type=str, choices=['dev', 'release'],
                         default='release',
                         help="Determines database access and debugging mode.")
+    parser.add_argument("--watch", type=float, default=10,
+                        help="Seconds between the checks for table changes.")
 
     return parser.parse_args()
 
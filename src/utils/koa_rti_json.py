@@ -0,0 +1,60 @@
+import json
+
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from email.utils import format_datetime
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# the format of datetimes in the results,  ie 2021-03-04 05:06:07
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def encode_value(obj):
+    """
+    Encode the database types the JSON encoders do not handle.
+
+    :param obj: the value from the query results
+    :return: (str/float) the JSON compatible value
+    """
+    if isinstance(obj, datetime):
+        # same as strftime(DATETIME_FORMAT) for naive whole seconds,  faster
+        if obj.microsecond or obj.tzinfo:
+            return obj.strftime(DATETIME_FORMAT)
+        return obj.isoformat(' ')
+    if isinstance(obj, date):
+        # the HTTP date format Flask's jsonify used,  ie
+        # Mon, 01 Jan 2024 00:00:00 GMT
+        midnight = datetime(obj.year, obj.month, obj.day, tzinfo=timezone.utc)
+        return format_datetime(midnight, usegmt=True)
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, timedelta):
+        return obj.total_seconds()
+    if isinstance(obj, (bytes, bytearray)):
+        return obj.decode('utf-8', errors='replace')
+    if isinstance(obj, (set, tuple)):
+        return list(obj)
+
+    raise TypeError(f"cannot encode {type(obj).__name__} as JSON")
+
+
+def dumps(obj):
+    """
+    Encode the results in one pass,  datetimes,  Decimals and bytes in the
+    rows are encoded as they are written.  Uses orjson when installed.
+
+    :param obj: (dict/list) the response
+    :return: (bytes) the UTF-8 JSON
+    """
+    if orjson:
+        return orjson.dumps(obj, default=encode_value,
+                            option=orjson.OPT_PASSTHROUGH_DATETIME |
+                            orjson.OPT_NON_STR_KEYS)
+
+    return json.dumps(obj, default=encode_value,
+                      separators=(',', ':')).encode('utf-8')
+
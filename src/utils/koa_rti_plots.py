@@ -8,6 +8,9 @@ from bokeh.models import ColumnDataSource
 from bokeh.plotting import figure
 from bokeh.transform import dodge
 
+# max bins in an OverlayTimePlot,  the largest default xrange is 1440 (mins)
+MAX_BINS = 1440
+
 
 class PlotBase:
 
@@ -39,18 +42,40 @@ class PlotBase:
 
     def get_plot(self):
         """
-        return the portions required for the bokeh plots
+        return the bokeh plot,  embed the plots of a page with embed_plots.
 
-        :return: (plot) to be embedded into html
+        :return: (plot) to be embedded into html,  None without data
         """
-        from bokeh.embed import file_html
-        from bokeh.resources import CDN
         if self.plt:
-            return file_html(self.plt, CDN, "TimePlot")
+            return self.plt
 
         return None
 
 
+def embed_plots(plots):
+    """
+    Embed all the plots of a page with one set of Bokeh resources and one
+    script (a single document),  instead of a standalone html page per plot.
+
+    :param plots: (list) bokeh plots,  None for a plot without data
+
+    :return: (dict) {'plots': [div or None], 'script': script to include once,
+                     'resources': the bokeh js/css tags to include once}
+    """
+    from bokeh.embed import components
+    from bokeh.resources import CDN
+
+    figures = [plt for plt in plots if plt is not None]
+    if not figures:
+        return {'plots': [None for plt in plots], 'script': '', 'resources': ''}
+
+    script, divs = components(figures)
+    divs = iter(divs)
+    divs = [next(divs) if plt is not None else None for plt in plots]
+
+    return {'plots': divs, 'script': script, 'resources': CDN.render()}
+
+
 class TimeBarPlot(PlotBase):
 
     def __init__(self, results, title):
@@ -112,19 +137,29 @@ class TimeBarPlot(PlotBase):
 
 class OverlayTimePlot(PlotBase):
 
-    def __init__(self, results, title, xrange=240, units=None):
+    def __init__(self, results, title, xrange=240, units=None,
+                 max_bins=MAX_BINS):
         """
-        Plot with all integer values between 0 and the largest time value
-        in the results.
+        Plot of the number of files by time,  from 0 to the largest time value
+        or xrange.  Times beyond xrange are counted in one overflow bin and
+        bins are widened to keep at most max_bins,  so the plot size does not
+        depend on outliers.
 
         :param results: (dict) the database query results
         :param title: (str) the plot title
+        :param xrange: (int) the largest time plotted in its own bin
+        :param units: (str) the time units for the axis label
+        :param max_bins: (int) the max number of bins,  not counting overflow
         """
 
         self.data = {}
         self.results = results
         self.title = title
         self.max_xrange = xrange
+        self.max_bins = max(int(max_bins), 1)
+        self.bin_width = 1
+        self.n_bins = 0
+        self.overflow = False
         self.last_val = 0
 
         self.insts = list(results.keys())
@@ -135,30 +170,58 @@ class OverlayTimePlot(PlotBase):
             cds = self.get_columndata()
             self.create_plot(cds, units=units)
 
+    def sparse_bins(self):
+        """
+        Re-bin the results to bin_width,  keeping only occupied bins.  Times
+        beyond max_xrange go to the overflow bin (index n_bins).
+
+        :return: (dict/dict) counts by bin index for each instrument
+        """
+        for inst in self.insts:
+            if self.results[inst]:
+                self.last_val = max(self.last_val, max(self.results[inst], key=int))
+        self.last_val += 1
+
+        x_end = int(min(self.last_val, self.max_xrange))
+        self.bin_width = max(-(-x_end // self.max_bins), 1)
+        self.n_bins = -(-x_end // self.bin_width)
+        self.overflow = self.last_val > self.max_xrange
+
+        sparse = {}
+        for inst in self.insts:
+            sparse[inst] = {}
+            for tm, num in self.results[inst].items():
+                tm = int(tm)
+                if tm >= x_end:
+                    idx = self.n_bins
+                else:
+                    idx = tm // self.bin_width
+                sparse[inst][idx] = sparse[inst].get(idx, 0) + num
+
+        return sparse
+
     def get_columndata(self):
         """
         Create a columndata source to be used with the Bokeh plots
 
         :return:
         """
-        time_set = set()
-        for inst in self.insts:
-            time_set |= set(self.results[inst])
-            self.last_val = max(self.last_val, max(self.results[inst], key=int))
-
-        self.last_val += 1
+        sparse = self.sparse_bins()
+        n_cols = self.n_bins + 1 if self.overflow else self.n_bins
 
         self.data = {}
         for inst in self.insts:
-            sums_dict = self.results[inst]
-            self.data[inst] = []
-            for i in range(0, self.last_val):
-                if i in sums_dict:
-                    self.data[inst].append(sums_dict[i])
-                else:
-                    self.data[inst].append(0)
+            self.data[inst] = [sparse[inst].get(i, 0) for i in range(n_cols)]
 
-        self.data['time_set'] = list(range(0, self.last_val))
+        x_end = self.n_bins * self.bin_width
+        self.data['time_set'] = [i * self.bin_width for i in range(n_cols)]
+        if self.bin_width == 1:
+            self.data['time_label'] = [str(tm) for tm in self.data['time_set']]
+        else:
+            self.data['time_label'] = [f'{tm}-{tm + self.bin_width - 1}'
+                                       for tm in self.data['time_set']]
+        if self.overflow:
+            self.data['time_label'][-1] = f'>= {x_end}'
 
         return ColumnDataSource(data=self.data)
 
@@ -169,7 +232,7 @@ class OverlayTimePlot(PlotBase):
             inst_tup = (inst_name, "@" + inst_name)
             tool_tips.append(inst_tup)
 
-        tool_tips.append(("TIME ", "@time_set (s)"))
+        tool_tips.append(("TIME ", "@time_label"))
 
         return tool_tips
 
@@ -181,15 +244,15 @@ class OverlayTimePlot(PlotBase):
         """
         if not units:
             units = 's'
-        self.max_xrange = int(min(self.last_val, self.max_xrange))
+        x_end = len(self.data['time_set']) * self.bin_width
         tool_tips = self.define_tooltip()
 
-        plt = figure(x_range=(0, self.max_xrange), plot_height=self.plt_ht,
+        plt = figure(x_range=(0, x_end), plot_height=self.plt_ht,
                      plot_width=self.plt_width, title=self.title,
                      tooltips=tool_tips,
                      tools="pan,box_zoom,xwheel_zoom,reset,hover")
 
-        bar_width = 1.0 / self.n_insts
+        bar_width = self.bin_width / self.n_insts
 
         for i in range(0, self.n_insts):
             offset = bar_width * (i % self.n_insts)
@@ -197,13 +260,15 @@ class OverlayTimePlot(PlotBase):
                      top=self.insts[i], width=bar_width, source=cds,
                      color=self.colors[i], legend_label=self.insts[i])
 
-        if self.max_xrange > 10:
-            tick_incr = int(self.max_xrange / 10)
+        if x_end > 10:
+            tick_incr = max(int(x_end / 10), self.bin_width)
         else:
             tick_incr = 1
-        ticks = list(range(0,self.last_val+tick_incr, tick_incr))
+        ticks = list(range(0, x_end + tick_incr, tick_incr))
         plt.xaxis.ticker = ticks
         plt.xaxis.axis_label = f"Time ({units})"
+        if self.overflow:
+            plt.xaxis.axis_label += f",  last bin >= {self.n_bins * self.bin_width}"
         plt.yaxis.axis_label = "Number of Files"
 
         self.plt = plt
@@ -0,0 +1,178 @@
+import itertools
+import logging
+import threading
+import time
+
+# seconds between the checks of the change detector
+WATCH_INTERVAL = 10
+
+# seconds without requests before a filter is no longer checked
+WATCH_IDLE = 600
+
+# the filter has not been checked yet
+UNSET = object()
+
+
+class WatchedFilter:
+
+    def __init__(self, check, version):
+        """
+        The change state of one filter,  shared by all of its clients.
+
+        :param check: (function) returns the change token of the filter
+        :param version: (int) the starting version
+        """
+        self.check = check
+        self.token = UNSET
+        self.version = version
+        self.cond = threading.Condition()
+        self.waiters = 0
+        self.last_used = time.monotonic()
+
+
+class ChangeWatcher:
+
+    def __init__(self, name, interval=WATCH_INTERVAL, idle=WATCH_IDLE):
+        """
+        One background thread checks every watched filter each interval
+        seconds and wakes the requests waiting on a filter when its change
+        token changes.  Each filter is checked once per interval no matter
+        how many clients are waiting on it,  and clients of other filters
+        are not woken.
+
+        :param name: (str) name of the detector thread
+        :param interval: (float) seconds between the checks
+        :param idle: (float) seconds before an unused filter is dropped
+        """
+        self.name = name
+        self.interval = interval
+        self.idle = idle
+
+        self.filters = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+        # versions are never reused,  also when a dropped filter is watched
+        # again,  so they can key cached results
+        self.versions = itertools.count(1)
+
+    def start(self):
+        """
+        Start the detector thread if it is not running.
+        """
+        with self.lock:
+            if self.thread and self.thread.is_alive():
+                return
+
+            self.thread = threading.Thread(target=self._run, name=self.name,
+                                           daemon=True)
+            self.thread.start()
+
+    def current(self, key, check):
+        """
+        Watch a filter and return its version.  A new filter is checked
+        right away so that changes from now on are seen.
+
+        :param key: (hashable) the filter,  None is never changed
+        :param check: (function) returns the change token of the filter,
+                                 ie the max last_mod of its rows
+        :return: (int) the version of the filter,  passed to wait()
+        """
+        if key is None:
+            return 0
+
+        self.start()
+        with self.lock:
+            watched = self.filters.get(key)
+            if not watched:
+                watched = WatchedFilter(check, next(self.versions))
+                self.filters[key] = watched
+            watched.last_used = time.monotonic()
+
+        if watched.token is UNSET:
+            self._check(key, watched)
+
+        return watched.version
+
+    def wait(self, key, version, timeout):
+        """
+        Block until a change of the filter after version or the timeout.
+
+        :param key: (hashable) the filter passed to current()
+        :param version: (int) the version from current()
+        :param timeout: (float) max seconds to wait
+
+        :return: (int) the current version,  equal to version on timeout
+        """
+        with self.lock:
+            watched = self.filters.get(key) if key is not None else None
+            if watched:
+                watched.waiters += 1
+
+        if not watched:
+            time.sleep(max(timeout, 0))
+            return version
+
+        end_time = time.monotonic() + timeout
+        try:
+            with watched.cond:
+                while watched.version == version:
+                    remaining = end_time - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    watched.cond.wait(remaining)
+
+                return watched.version
+        finally:
+            with self.lock:
+                watched.waiters -= 1
+                watched.last_used = time.monotonic()
+
+    def token(self, key):
+        """
+        :param key: (hashable) the filter passed to current()
+        :return: the last change token of the filter,  None if not checked
+        """
+        with self.lock:
+            watched = self.filters.get(key) if key is not None else None
+
+        if not watched or watched.token is UNSET:
+            return None
+
+        return watched.token
+
+    def stats(self):
+        """
+        :return: (dict) the number of watched filters and waiting requests
+        """
+        with self.lock:
+            return {'filters': len(self.filters),
+                    'waiters': sum(f.waiters for f in self.filters.values())}
+
+    def _check(self, key, watched):
+        try:
+            token = watched.check()
+        except Exception as err:
+            logging.getLogger('wmko_rti_api').warning(
+                f"{self.name}: change check of {key} failed: {err}")
+            return
+
+        with watched.cond:
+            if watched.token is not UNSET and token != watched.token:
+                watched.version = next(self.versions)
+                watched.cond.notify_all()
+            watched.token = token
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+
+            now = time.monotonic()
+            with self.lock:
+                for key, watched in list(self.filters.items()):
+                    if not watched.waiters and now - watched.last_used > self.idle:
+                        del self.filters[key]
+                watched_filters = list(self.filters.items())
+
+            for key, watched in watched_filters:
+                self._check(key, watched)